@@ -1,7 +1,6 @@
 # coding: utf-8
-from bottle import template
+from plexarr.utils import XMLTVWriter
 from base64 import b64decode
-from pathlib import Path
 from furl import furl
 
 url = lemo.api_url
@@ -55,5 +54,4 @@ for epg_item in epg_listings:
     )
 
 url = furl(url).origin
-tpl = str(next(Path.cwd().rglob("epg.tpl")))
-print(template(tpl, channels=channels, programs=programs, url=url))
+print("".join(XMLTVWriter(url=url).iter(channels, programs)), end="")
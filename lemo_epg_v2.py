@@ -1,7 +1,6 @@
 # coding: utf-8
 from plexarr import LemoAPI
-from bottle import template
-from pathlib import Path
+from plexarr.utils import XMLTVWriter
 
 from itertools import chain
 from teddy import convertEPGTime
@@ -57,5 +56,4 @@ programs = list(chain(*(program(c) for c in channels[:4])))
 
 
 url = furl(url).origin
-tpl = str(next(Path.cwd().rglob("epg.tpl")))
-print(template(tpl, channels=channels, programs=programs, url=url))
+print("".join(XMLTVWriter(url=url).iter(channels, programs)), end="")
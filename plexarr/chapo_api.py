@@ -4,12 +4,10 @@ from configparser import ConfigParser
 from pathlib import Path
 
 import pandas as pd
-import requests
 # from pandas.tseries.offsets import Week
 from rich import inspect
 # from teddy import convertEPGTime, getEPGTimeNow
-from .utils import convertEPGTime, getEPGTimeNow
-from bottle import template
+from .utils import convertEPGTime, getEPGTimeNow, M3UWriter, ResponseCache, XMLTVWriter
 from furl import furl
 # from .utils import gen_xmltv_xml
 
@@ -17,8 +15,13 @@ from furl import furl
 class ChapoAPI(object):
     """REST API Wrapper for ChapoStreamz!"""
 
-    def __init__(self):
-        """Configs"""
+    def __init__(self, ttls={}):
+        """
+        Configs
+
+        ARGS:
+            ttls (dict) - per-action response cache TTLs in seconds, ex: {"get_live_streams": 60}
+        """
         config = ConfigParser()
         config.read(Path(Path.home(), '.config/plexarr.ini'))
 
@@ -31,6 +34,7 @@ class ChapoAPI(object):
         }
         self.CATEGORY = {}
         self.STREAMS = {}
+        self.cache = ResponseCache(ttls=ttls)
 
     def getCategories(self, groups='', terms=''):
         """
@@ -39,39 +43,37 @@ class ChapoAPI(object):
         ARGS:
             groups (str|list) - ex: "USA Sports" or ['USA News', 'USA Sports']
         """
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_categories'})
-        r = requests.get(url=self.API_URL, params=payload)
+        payload = dict(self.PARAMS, action='get_live_categories')
+        categories = self.cache.get(self.API_URL, params=payload)
 
         if groups:
-            return list(filter(lambda x: x["category_name"] in groups, r.json()))
+            return list(filter(lambda x: x["category_name"] in groups, categories))
         if terms:
             terms = [terms] if isinstance(terms, str) else terms
-            return list(filter(lambda x: any(term in x["category_name"].lower() for term in terms), r.json()))
-        return r.json()
+            return list(filter(lambda x: any(term in x["category_name"].lower() for term in terms), categories))
+        return categories
 
 
     def getCategory(self, query=''):
         """Get Category using query filter"""
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_categories'})
-        r = requests.get(url=self.API_URL, params=payload)
-        return next((cat for cat in r.json() if query.lower() in cat.get('category_name').lower()), {})
+        payload = dict(self.PARAMS, action='get_live_categories')
+        categories = self.cache.get(self.API_URL, params=payload)
+        return next((cat for cat in categories if query.lower() in cat.get('category_name').lower()), {})
 
     def setCategory(self, query=''):
         """Set Category using 'query' filter"""
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_categories'})
-        r = requests.get(url=self.API_URL, params=payload)
-        self.CATEGORY = next((cat for cat in r.json() if query.lower() in cat.get('category_name').lower()), {})
+        payload = dict(self.PARAMS, action='get_live_categories')
+        categories = self.cache.get(self.API_URL, params=payload)
+        self.CATEGORY = next((cat for cat in categories if query.lower() in cat.get('category_name').lower()), {})
 
     def getStreams(self, terms='', bad_terms='BAD TERMS'):
         """Get Streams by Category_ID and filtered by 'terms'"""
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_streams'})
-        payload.update({'category_id': self.CATEGORY.get("category_id")})
-        r = requests.get(url=self.API_URL, params=payload)
-        return (stream for stream in r.json() if terms.lower() in stream.get('name').lower() and bad_terms not in stream.get('name'))
+        payload = dict(self.PARAMS, action='get_live_streams', category_id=self.CATEGORY.get("category_id"))
+        streams = self.cache.get(self.API_URL, params=payload)
+        return (
+            stream for stream in streams
+            if terms.lower() in stream.get('name').lower() and bad_terms not in stream.get('name')
+        )
 
     def getStreamsNFL(self, terms=[], rejects=[]):
         """Get NFL Streams"""
@@ -90,38 +92,36 @@ class ChapoAPI(object):
         streams = self.getStreams(terms="NBA ", bad_terms="*")
         return streams
 
-    def m3uNFL(self):
-        """Generate m3u for NFL Streams"""
-        m3u = "#EXTM3U\n"
-        tvg_cuid = 702
-        for i, stream in enumerate(self.getStreamsNFL(terms=['nfl 0', 'nfl 1'])):
-            tvg_id = stream.get("stream_id")
-            tvg_name = stream.get("name").split(":")[0].strip()
-            tvg_logo = stream.get("stream_icon")
-            tvg_group = "NFL Gamepass"
-
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
-
-    def m3uNBA(self):
-        """Generate m3u for NBA Streams"""
-        m3u = "#EXTM3U\n"
-        tvg_cuid = 801
-        for i, stream in enumerate(self.getStreamsNBA()):
-            tvg_id = stream.get("stream_id")
-            tvg_name = stream.get("name").split(":")[0].strip()
-            tvg_logo = stream.get("stream_icon")
-            tvg_group = "NBA Games"
-
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
-
-    def xmlNFL(self):
-        """Generate xml for NFL Streams"""
+    def iterM3U(self, streams, tvg_cuid=1, tvg_logo=None, tvg_group=""):
+        """Yield m3u lines one stream at a time (tvg_logo defaults to the stream icon)"""
+        entries = (
+            {
+                "url": self.API_URL.replace(
+                    '/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{stream.get("stream_id")}'
+                ),
+                "tvg_cuid": cuid,
+                "tvg_id": stream.get("stream_id"),
+                "tvg_name": stream.get("name").split(":")[0].strip(),
+                "tvg_logo": stream.get("stream_icon") if tvg_logo is None else tvg_logo,
+                "tvg_group": tvg_group,
+            }
+            for cuid, stream in enumerate(streams, start=tvg_cuid)
+        )
+        return M3UWriter().iter(entries)
+
+    def m3uNFL(self, stream=False):
+        """Generate m3u for NFL Streams (stream=True returns a line generator)"""
+        streams = self.getStreamsNFL(terms=['nfl 0', 'nfl 1'])
+        m3u = self.iterM3U(streams, tvg_cuid=702, tvg_group="NFL Gamepass")
+        return m3u if stream else "".join(m3u)
+
+    def m3uNBA(self, stream=False):
+        """Generate m3u for NBA Streams (stream=True returns a line generator)"""
+        m3u = self.iterM3U(self.getStreamsNBA(), tvg_cuid=801, tvg_group="NBA Games")
+        return m3u if stream else "".join(m3u)
+
+    def xmlNFL(self, stream=False):
+        """Generate xml for NFL Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         for stream in self.getStreamsNFL():
@@ -168,13 +168,11 @@ class ChapoAPI(object):
                     except Exception as e:
                         inspect(e)
                         pass
-        # return gen_xmltv_xml(channels=channels, programs=programs, url=self.API_URL)
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
 
-    def xmlNBA(self):
-        """Generate xml for NBA Streams"""
+    def xmlNBA(self, stream=False):
+        """Generate xml for NBA Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         for stream in self.getStreamsNBA():
@@ -205,7 +203,5 @@ class ChapoAPI(object):
                 except Exception as e:
                     inspect(e)
                     pass
-        # return gen_xmltv_xml(channels=channels, programs=programs, url=self.API_URL)
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
@@ -1,10 +1,13 @@
 from .utils import to_csv, read_csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
+from functools import lru_cache
 from pathlib import Path
 from rich import print
 from furl import furl
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import re
 
@@ -12,8 +15,12 @@ import re
 class ESPN_API(object):
     """REST API Wrapper for GitHub"""
 
-    def __init__(self, load=True, nba=False, wnba=False):
+    def __init__(self, load=True, nba=False, wnba=False, workers=16):
         """Endpoints: https://gist.github.com/nntrn/ee26cb2a0716de0947a0a4e9a157bc1c"""
+        # -- shared keep-alive session sized for the $ref worker pool
+        self.WORKERS = workers
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=workers, pool_maxsize=workers))
         self.YEAR = self.getYear() if not wnba else self.getYear(month=4)
         if nba:
             self.API_URL = 'https://sports.core.api.espn.com/v2/sports/basketball/leagues/nba'
@@ -48,14 +55,14 @@ class ESPN_API(object):
         params.update(data)
 
         url = furl(self.API_URL.strip('/')+'/').join(path.strip('/'))
-        r = requests.get(url=url, params=params)
+        r = self.session.get(url=url, params=params)
         return r.json()
 
     def getURL(self, url='', data={}):
         """Requests GET URL Wrapper"""
         params = self.PARAMS
         params.update(data)
-        r = requests.get(url, params=params)
+        r = self.session.get(url, params=params)
         return r.json()
 
     def getItem(self, path='/', data={}):
@@ -64,9 +71,17 @@ class ESPN_API(object):
         return self.get(path=path, data=data)
     
     def getItems(self, path='/', data={}):
-        """Requests Nested get(): [getURL()] Wrapper"""
+        """Requests Nested get(): [getURL()] Wrapper (refs are de-duplicated and resolved concurrently)"""
         print(f'path = "{path}"')
-        return [self.getURL(item["$ref"]) for item in self.get(path=path, data=data)["items"]]
+        refs = [item["$ref"] for item in self.get(path=path, data=data)["items"]]
+        return self.getRefs(refs)
+
+    def getRefs(self, refs=[]):
+        """Resolve "$ref" links with a bounded worker pool, fetching each unique link once"""
+        unique = list(dict.fromkeys(refs))
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            resolved = dict(zip(unique, pool.map(self.getURL, unique)))
+        return [resolved[ref] for ref in refs]
 
     def getNFLTeams(self, year=0, data={}, update=False):
         year = year if year else self.YEAR
@@ -196,14 +211,7 @@ class ESPN_API(object):
                 for week in self.getItems(path=path_weeks, data=data):
                     path_events = f'{path_weeks}/{week["number"]}/events'
                     for event in self.getItems(path=path_events, data=data):
-                        df_event = pd.DataFrame.from_records([
-                            {"team_id": team["id"], "homeAway": team["homeAway"]}
-                            for team in event["competitions"][0]["competitors"]
-                        ])
-                        df_game = df_event.merge(self.df_teams)
-                        home = df_game[df_game["homeAway"] == "home"].squeeze()
-                        away = df_game[df_game["homeAway"] == "away"].squeeze()
-
+                        teams = {team["homeAway"]: team["id"] for team in event["competitions"][0]["competitors"]}
                         game = {
                             "season": season["name"],
                             "season_type": season["id"],
@@ -213,12 +221,11 @@ class ESPN_API(object):
                             "game_name": event["name"],
                             "game_short": event["shortName"],
                             "game_date": event["date"],
-                            "home_team": "" if home.empty else home["team_name"] ,
-                            "home_venue": "" if home.empty else home["team_venue"],
-                            "away_team": "" if away.empty else away["team_name"],
+                            "home_id": teams.get("home"),
+                            "away_id": teams.get("away"),
                         }
                         schedule.append(game)
-            df_schedule = pd.DataFrame.from_records(schedule)
+            df_schedule = joinTeams(pd.DataFrame.from_records(schedule), self.df_teams)
             df_schedule["week_start"] = pd.to_datetime(df_schedule["week_start"])
             df_schedule["week_end"] = pd.to_datetime(df_schedule["week_end"])
             df_schedule["game_date"] = pd.to_datetime(df_schedule["game_date"])
@@ -232,32 +239,32 @@ class ESPN_API(object):
         path = '/events'
         data.update({"dates": today})
         
-        schedule = []
-        for event in self.getItems(path=path, data=data):
-            season = self.getURL(url=event["seasonType"]["$ref"], data=data)
-            df_event = pd.DataFrame.from_records([
-                {"team_id": team["id"], "homeAway": team["homeAway"]}
-                for team in event["competitions"][0]["competitors"]
-            ])
-            df_game = df_event.merge(self.df_teams)
-            game_time = pd.to_datetime(event["date"], utc=True).tz_convert('US/Eastern')
-            home = df_game[df_game["homeAway"] == "home"].squeeze()
-            away = df_game[df_game["homeAway"] == "away"].squeeze()
+        events = self.getItems(path=path, data=data)
+        # -- every event links the same few season types
+        seasons = self.getRefs([event["seasonType"]["$ref"] for event in events])
 
+        schedule = []
+        for event, season in zip(events, seasons):
+            teams = {team["homeAway"]: team["id"] for team in event["competitions"][0]["competitors"]}
             game = {
                 "season": season["name"],
                 "season_type": season["id"],
-                "day_start":  game_time.replace(hour=0, minute=0, second=0),
-                "day_end":    game_time.replace(hour=23, minute=59, second=59),
-                "game_time":  game_time,
+                "game_time": event["date"],
                 "game_name": event["name"],
                 "game_short": event["shortName"],
-                "home_team": "" if home.empty else home["team_name"] ,
-                "home_venue": "" if home.empty else home["team_venue"],
-                "away_team": "" if away.empty else away["team_name"],
+                "home_id": teams.get("home"),
+                "away_id": teams.get("away"),
             }
             schedule.append(game)
-        df_schedule = pd.DataFrame.from_records(schedule)
+        if not schedule:
+            return pd.DataFrame()
+
+        df_schedule = joinTeams(pd.DataFrame.from_records(schedule), self.df_teams)
+        game_time = pd.to_datetime(df_schedule["game_time"], utc=True).dt.tz_convert('US/Eastern')
+        day_start, day_end = gameDays(game_time)
+        df_schedule["game_time"] = game_time
+        df_schedule.insert(2, "day_start", day_start)
+        df_schedule.insert(3, "day_end", day_end)
         return df_schedule
 
     
@@ -308,23 +315,140 @@ class ESPN_API(object):
         USA NFL Sunday 708
         {'channel': 'USA NFL Sunday 708', 'team1': None, 'team2': None, 'time': None}
         """
-        # nfl_teams = "|".join([team["team_name"] for team in self.NFL_TEAMS])
-        #nfl_teams = "|".join(self.df_teams["team_name"])
-
-        # regex = (
-        #     rf"(?P<tvg_name>\w+\s+\w+\s+\w+\s+(\d+|\w+))(\s|:)*"
-        #     rf"(?P<team1>(?:{nfl_teams}))*(\svs\s+)*"
-        #     rf"(?P<team2>(?:{nfl_teams}))*(\s*@\s*|\s*\(\s*)*"
-        #     rf"(?P<time>\d+:\d+\s*\w+)*(\)|)*"
-        # )
-        # m = re.compile(regex. re.IGNORECASE)
-        # return m.search(line).groupdict()
-
-        nfl_teams = "|".join(self.df_teams.team_name.values)
-        regex = rf'(?P<tvg_name>[\w\s]+)[:]\s+(?P<team1>({nfl_teams}))[vsat\s]*(?P<team2>({nfl_teams}))[\s@]+(?P<time>[\d:]+\s*[AMP]*)'
-        return re.search(regex, line, flags=re.IGNORECASE).groupdict()
+        return self.teamMatcher().parse(line)
 
     def parseWNBAInfo(self, line):
-        wnba_teams = "|".join(self.df_teams.team_name.values)
-        regex = rf'(?P<tvg_name>[\w\s]+)[:]\s+(?P<team1>({wnba_teams}))[vsat\s]*(?P<team2>({wnba_teams}))[\s@]+(?P<time>[\d:]+\s*[AMP]*)'
-        return re.search(regex, line, flags=re.IGNORECASE).groupdict()
+        return self.teamMatcher().parse(line)
+
+    def teamMatcher(self):
+        """Compiled TeamMatcher for self.df_teams (rebuilt only when the team table changes)"""
+        return getTeamMatcher(tuple(self.df_teams.team_name), tuple(self.df_teams.team_nick))
+
+
+def joinTeams(df_games, df_teams):
+    """
+    Attach team names and the home venue to a schedule with one vectorized merge per side
+
+    ARGS:
+        df_games (DataFrame) - one row per game with "home_id" and "away_id" columns
+        df_teams (DataFrame) - team table with "team_id", "team_name", "team_venue"
+    Returns:
+        df_games without the id columns, plus "home_team", "home_venue", "away_team" ("" when unmatched)
+    """
+    teams = df_teams[["team_id", "team_name", "team_venue"]].astype({"team_id": str})
+    home = teams.rename(columns={"team_id": "home_id", "team_name": "home_team", "team_venue": "home_venue"})
+    away = teams[["team_id", "team_name"]].rename(columns={"team_id": "away_id", "team_name": "away_team"})
+    df = df_games.astype({"home_id": str, "away_id": str})
+    df = df.merge(home, how="left", on="home_id").merge(away, how="left", on="away_id")
+    df[["home_team", "home_venue", "away_team"]] = df[["home_team", "home_venue", "away_team"]].fillna("")
+    return df.drop(columns=["home_id", "away_id"])
+
+
+def gameDays(game_time):
+    """Local (wall clock) start and end of each game's day for a tz-aware datetime Series"""
+    local = game_time.dt.tz_localize(None).dt.normalize()
+    day_start = local.dt.tz_localize(game_time.dt.tz)
+    day_end = (local + pd.Timedelta(hours=23, minutes=59, seconds=59)).dt.tz_localize(game_time.dt.tz)
+    return day_start, day_end
+
+
+class ScheduleIndex(object):
+    """
+    Team-Pair Lookup Index for a Schedule DataFrame
+
+    Built once per EPG run instead of filtering the whole schedule for every stream.
+    Games are keyed by frozenset({home_team, away_team}), so a lookup is a dict hit plus
+    a scan over the (few) meetings of that pair in a season.
+
+    Usage:
+        schedule = ScheduleIndex(espn.getNFLSchedule(), start="week_start", end="week_end")
+        game = schedule.lookup(["Chicago Bears", "Houston Texans"], date_now)
+        game["home_team"], game["game_date"]
+    """
+
+    def __init__(self, df_schedule=None, start="day_start", end="day_end"):
+        self.start = start
+        self.end = end
+        self.games = {}
+        records = [] if df_schedule is None else df_schedule.to_dict(orient="records")
+        for game in records:
+            # -- csv columns with mixed UTC offsets (EST/EDT) can load as strings
+            game[start] = pd.to_datetime(game[start], utc=True)
+            game[end] = pd.to_datetime(game[end], utc=True)
+            self.games.setdefault(frozenset((game["home_team"], game["away_team"])), []).append(game)
+        for games in self.games.values():
+            games.sort(key=lambda game: game[start])
+
+    def lookup(self, teams, *when):
+        """
+        Find the game between 'teams' whose [start, end] window contains a time in 'when'
+
+        ARGS:
+            teams (list) - both team names, in any order
+            when (datetime) - times to try in order (ex: date_now, date_now - 6 hours)
+        Raises:
+            LookupError - when no game matches
+        """
+        games = self.games.get(frozenset(teams), [])
+        for dt_when in when:
+            for game in games:
+                if game[self.start] <= dt_when <= game[self.end]:
+                    return game
+        raise LookupError(f'no scheduled game for: {teams}')
+
+
+class TeamMatcher(object):
+    """
+    Precompiled Stream-Name Parser for a Team Table
+
+    The team alternation is compiled once (longest names first), tolerates repeated whitespace
+    inside team names and also accepts unambiguous nicknames. Matches are normalized back to the
+    canonical "team_name", so results can be used directly as ScheduleIndex keys.
+
+    Usage:
+        matcher = getTeamMatcher(tuple(df_teams.team_name), tuple(df_teams.team_nick))
+        matcher.parse("USA NFL Sunday 705: Philadelphia Eagles vs  Browns @ 01:00 PM")
+        {'tvg_name': 'USA NFL Sunday 705', 'team1': 'Philadelphia Eagles', 'team2': 'Cleveland Browns',
+         'time': '01:00 PM'}
+    """
+
+    def __init__(self, team_names=(), team_nicks=()):
+        self.teams = {self.normalize(name): name for name in team_names}
+        nicks = [self.normalize(nick) for nick in team_nicks if nick]
+        for name, nick in zip(team_names, team_nicks):
+            if nick and nicks.count(self.normalize(nick)) == 1:
+                self.teams.setdefault(self.normalize(nick), name)
+
+        names = sorted(self.teams, key=len, reverse=True)
+        teams = "|".join(r"\s+".join(map(re.escape, name.split())) for name in names)
+        self.regex = re.compile(
+            rf'(?P<tvg_name>[\w\s]+)[:]\s+(?P<team1>{teams})[vsat\s]*(?P<team2>{teams})'
+            rf'[\s@(]+(?P<time>[\d:]+\s*[AMP]*)',
+            flags=re.IGNORECASE
+        )
+
+    @staticmethod
+    def normalize(name):
+        """Lowercase and collapse whitespace"""
+        return " ".join(str(name).lower().split())
+
+    def parse(self, line):
+        """
+        Parse tvg_name, team1, team2 and time from a stream name
+
+        Raises:
+            ValueError - when the line does not name two known teams
+        """
+        m = self.regex.search(line)
+        if not m:
+            raise ValueError(f'no teams found in: "{line}"')
+        info = m.groupdict()
+        info["team1"] = self.teams[self.normalize(info["team1"])]
+        info["team2"] = self.teams[self.normalize(info["team2"])]
+        return info
+
+
+@lru_cache(maxsize=8)
+def getTeamMatcher(team_names=(), team_nicks=()):
+    """Cached TeamMatcher per team table (keyed by its contents)"""
+    return TeamMatcher(team_names, team_nicks)
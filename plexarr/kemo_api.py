@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 from itertools import chain
 from pathlib import Path
@@ -5,16 +6,14 @@ import json
 import re
 
 import pandas as pd
-import requests
 from pandas.tseries.offsets import Week
 # from teddy import convertEPGTime, getEPGTimeNow
-from .utils import convertEPGTime, getEPGTimeNow
-from bottle import template
+from .utils import convertEPGTime, getEPGTimeNow, M3UWriter, ResponseCache, XMLTVWriter
 from furl import furl
 # from .utils import gen_xmltv_xml
 # from .utils import getNFLTeams
 
-from .espn_api import ESPN_API
+from .espn_api import ESPN_API, ScheduleIndex
 from .nba_api import NBA_API
 
 
@@ -105,8 +104,13 @@ class KemoAPI(object):
             print({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop, "epg_desc": epg_desc})
     """
 
-    def __init__(self, iptv='lemo', nba=False, wnba=False):
-        """Configs"""
+    def __init__(self, iptv='lemo', nba=False, wnba=False, ttls={}):
+        """
+        Configs
+
+        ARGS:
+            ttls (dict) - per-action response cache TTLs in seconds, ex: {"get_live_streams": 60}
+        """
         config = ConfigParser()
         config.read(Path(Path.home(), '.config/plexarr.ini'))
         conf = dict(config[iptv].items())
@@ -115,10 +119,19 @@ class KemoAPI(object):
         self.PASSWORD = conf.get("password")
         self.PARAMS = {"username": self.USERNAME, "password": self.PASSWORD}
         self.CATEGORY = {}
+        self.CATEGORIES = []
         self.STREAMS = {}
+        self.cache = ResponseCache(ttls=ttls)
         self.espn = ESPN_API(wnba=wnba)
         self.nba = NBA_API()
 
+    def fetchCategories(self):
+        """Get All Categories (buildAll() prefetches them into self.CATEGORIES)"""
+        if self.CATEGORIES:
+            return self.CATEGORIES
+        payload = dict(self.PARAMS, action='get_live_categories')
+        return self.cache.get(self.API_URL, params=payload)
+
     def getCategories(self, groups='', terms=''):
         """
         Get All Categories in Matching Groups
@@ -126,38 +139,35 @@ class KemoAPI(object):
         ARGS:
             groups (str|list) - ex: "USA Sports" or ['USA News', 'USA Sports']
         """
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_categories'})
-        r = requests.get(url=self.API_URL, params=payload)
+        categories = self.fetchCategories()
 
         if groups:
-            return list(filter(lambda x: x["category_name"] in groups, r.json()))
+            return list(filter(lambda x: x["category_name"] in groups, categories))
         if terms:
             terms = [terms] if isinstance(terms, str) else terms
-            return list(filter(lambda x: any(term in x["category_name"].lower() for term in terms), r.json()))
-        return r.json()
+            return list(filter(lambda x: any(term in x["category_name"].lower() for term in terms), categories))
+        return categories
 
     def getCategory(self, query=''):
         """Get Category using query filter"""
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_categories'})
-        r = requests.get(url=self.API_URL, params=payload)
-        return next((cat for cat in r.json() if query.lower() in cat.get('category_name').lower()), {})
+        categories = self.fetchCategories()
+        return next((cat for cat in categories if query.lower() in cat.get('category_name').lower()), {})
 
     def setCategory(self, query=''):
         """Set Category using 'query' filter"""
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_categories'})
-        r = requests.get(url=self.API_URL, params=payload)
-        self.CATEGORY = next((cat for cat in r.json() if query.lower() in cat.get('category_name').lower()), {})
+        categories = self.fetchCategories()
+        self.CATEGORY = next((cat for cat in categories if query.lower() in cat.get('category_name').lower()), {})
+
+    def fetchStreams(self, category_id=None):
+        """Get All Streams for a Category_ID"""
+        payload = dict(self.PARAMS, action='get_live_streams', category_id=category_id)
+        return self.cache.get(self.API_URL, params=payload)
 
     def getStreams(self, terms=''):
         """Get Streams by Category_ID and filtered by 'terms'"""
-        payload = self.PARAMS
-        payload.update({'action': 'get_live_streams'})
-        payload.update({'category_id': self.CATEGORY.get("category_id")})
-        r = requests.get(url=self.API_URL, params=payload)
-        streams = r.json()
+        category_id = self.CATEGORY.get("category_id")
+        # -- buildAll() prefetches every league's category into self.STREAMS
+        streams = self.STREAMS[category_id] if category_id in self.STREAMS else self.fetchStreams(category_id)
 
         if isinstance(terms, str):
             return (stream for stream in streams if terms.lower() in stream.get('name').lower())
@@ -170,11 +180,8 @@ class KemoAPI(object):
 
     def getEPG(self, stream_id=0):
         """Get All EPG for Live Stream"""
-        payload = self.PARAMS
-        payload.update({'action': 'get_simple_data_table'})
-        payload.update({'stream_id': stream_id})
-        r = requests.get(url=self.API_URL, params=payload)
-        return r.json()
+        payload = dict(self.PARAMS, action='get_simple_data_table', stream_id=stream_id)
+        return self.cache.get(self.API_URL, params=payload)
 
     def getStreamsNFL(self):
         """Get NFL Streams"""
@@ -281,97 +288,132 @@ class KemoAPI(object):
         streams = self.getStreams(terms=terms)
         return streams
 
-    def m3uNFL(self, tvg_cuid=702):
-        """Generate m3u for NFL Streams"""
-        m3u = "#EXTM3U\n"
-        for i, stream in enumerate(self.getStreamsNFL()):
-            tvg_id = stream.get("stream_id")
-            tvg_name = stream.get("name").split(":")[0].strip()
-            tvg_logo = "http://line.lemotv.cc/images/d7a1c666d3827922b7dfb5fbb9a3b450.png"
-            tvg_group = "NFL Sunday Games"
-
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
-
-    def m3uNBA(self, tvg_cuid=801):
-        """Generate m3u for NBA Streams"""
-        m3u = "#EXTM3U\n"
-        for i, stream in enumerate(self.getStreamsNBA()):
-            tvg_id = stream.get("stream_id")
-            tvg_name = stream.get("name").split(":")[0].strip()
-            tvg_logo = "http://line.lemotv.cc/images/118ae626674246e6d081a4ff16921b19.png"
-            tvg_group = "NBA Games"
-
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
-
-    def m3uNCAAB(self, tvg_cuid=240):
-        """Generate m3u for NCAAB Streams"""
-        m3u = "#EXTM3U\n"
-        for i, stream in enumerate(self.getStreamsNCAAB()):
-            tvg_id = stream.get("stream_id")
-            # tvg_name = stream.get("name").split(":")[0].strip()
-            tvg_name = re.search(r'(NCAAB \d+)', stream.get("name")).group()
-            tvg_logo = "https://upload.wikimedia.org/wikipedia/commons/thumb/2/28/March_Madness_logo.svg/250px-March_Madness_logo.svg.png"
-            tvg_group = "NCAAB Games"
-
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
-
-    def m3uNCAAW(self, tvg_cuid=260):
-        """Generate m3u for NCAAB Streams"""
-        m3u = "#EXTM3U\n"
-        for i, stream in enumerate(self.getStreamsNCAAW()):
-            tvg_id = stream.get("stream_id")
-            tvg_name = stream.get("name").split(":")[0].strip()
-            # tvg_name = re.search(r'(NCAAW B \d+)', stream.get("name")).group()
-            tvg_logo = "https://upload.wikimedia.org/wikipedia/commons/thumb/2/28/March_Madness_logo.svg/250px-March_Madness_logo.svg.png"
-            tvg_group = "NCAAW Games"
-
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
+    def iterM3U(self, streams, tvg_cuid=1, tvg_logo="", tvg_group="", tvg_name=None):
+        """
+        Yield m3u lines one stream at a time
 
-    def m3uWNBA(self, tvg_cuid=13):
-        """Generate m3u for NBA Streams"""
-        m3u = "#EXTM3U\n"
-        for i, stream in enumerate(self.getStreamsWNBA()):
-            tvg_id = stream.get("stream_id")
-            tvg_name = stream.get("name").split(":")[0].strip()
-            tvg_logo = "https://i0.wp.com/winsidr.com/wp-content/uploads/2023/05/WNBALogo_1997.png?resize=300%2C300&ssl=1"
-            tvg_group = "WNBA Games"
+        ARGS:
+            streams (iter) - streams from getStreams*()
+            tvg_name (callable) - derive tvg-name from the stream (default: text before the first ":")
+        """
+        tvg_name = tvg_name if tvg_name else (lambda stream: stream.get("name").split(":")[0].strip())
+        entries = (
+            {
+                "url": self.API_URL.replace(
+                    '/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{stream.get("stream_id")}'
+                ),
+                "tvg_cuid": cuid,
+                "tvg_id": stream.get("stream_id"),
+                "tvg_name": tvg_name(stream),
+                "tvg_logo": tvg_logo,
+                "tvg_group": tvg_group,
+            }
+            for cuid, stream in enumerate(streams, start=tvg_cuid)
+        )
+        return M3UWriter().iter(entries)
+
+    def m3uNFL(self, tvg_cuid=702, stream=False):
+        """Generate m3u for NFL Streams (stream=True returns a line generator)"""
+        tvg_logo = "http://line.lemotv.cc/images/d7a1c666d3827922b7dfb5fbb9a3b450.png"
+        tvg_group = "NFL Sunday Games"
+        m3u = self.iterM3U(self.getStreamsNFL(), tvg_cuid=tvg_cuid, tvg_logo=tvg_logo, tvg_group=tvg_group)
+        return m3u if stream else "".join(m3u)
 
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
+    def m3uNBA(self, tvg_cuid=801, stream=False):
+        """Generate m3u for NBA Streams (stream=True returns a line generator)"""
+        tvg_logo = "http://line.lemotv.cc/images/118ae626674246e6d081a4ff16921b19.png"
+        tvg_group = "NBA Games"
+        m3u = self.iterM3U(self.getStreamsNBA(), tvg_cuid=tvg_cuid, tvg_logo=tvg_logo, tvg_group=tvg_group)
+        return m3u if stream else "".join(m3u)
+
+    def m3uNCAAB(self, tvg_cuid=240, stream=False):
+        """Generate m3u for NCAAB Streams (stream=True returns a line generator)"""
+        tvg_logo = (
+            "https://upload.wikimedia.org/wikipedia/commons/thumb/2/28/"
+            "March_Madness_logo.svg/250px-March_Madness_logo.svg.png"
+        )
+        tvg_group = "NCAAB Games"
+
+        def tvg_name(ncaab_stream):
+            return re.search(r'(NCAAB \d+)', ncaab_stream.get("name")).group()
+
+        m3u = self.iterM3U(self.getStreamsNCAAB(), tvg_cuid=tvg_cuid, tvg_logo=tvg_logo, tvg_group=tvg_group,
+                           tvg_name=tvg_name)
+        return m3u if stream else "".join(m3u)
+
+    def m3uNCAAW(self, tvg_cuid=260, stream=False):
+        """Generate m3u for NCAAW Streams (stream=True returns a line generator)"""
+        tvg_logo = (
+            "https://upload.wikimedia.org/wikipedia/commons/thumb/2/28/"
+            "March_Madness_logo.svg/250px-March_Madness_logo.svg.png"
+        )
+        tvg_group = "NCAAW Games"
+        m3u = self.iterM3U(self.getStreamsNCAAW(), tvg_cuid=tvg_cuid, tvg_logo=tvg_logo, tvg_group=tvg_group)
+        return m3u if stream else "".join(m3u)
+
+    def m3uWNBA(self, tvg_cuid=13, stream=False):
+        """Generate m3u for WNBA Streams (stream=True returns a line generator)"""
+        tvg_logo = "https://i0.wp.com/winsidr.com/wp-content/uploads/2023/05/WNBALogo_1997.png?resize=300%2C300&ssl=1"
+        tvg_group = "WNBA Games"
+        m3u = self.iterM3U(self.getStreamsWNBA(), tvg_cuid=tvg_cuid, tvg_logo=tvg_logo, tvg_group=tvg_group)
+        return m3u if stream else "".join(m3u)
+
+    def m3uESPN(self, terms="", tvg_cuid=1500, stream=False):
+        """Generate m3u for ESPN PLUS Streams (stream=True returns a line generator)"""
+        tvg_logo = (
+            "https://artwork.espncdn.com/programs/14ef54cc-6fd8-443d-80b8-365c1f64d606/16x9/large_20211213222642.jpg"
+        )
+        tvg_group = "ESPN+"
+        m3u = self.iterM3U(self.getStreamsESPN(terms=terms), tvg_cuid=tvg_cuid, tvg_logo=tvg_logo,
+                           tvg_group=tvg_group)
+        return m3u if stream else "".join(m3u)
+
+    def buildAll(self, leagues=["nfl", "nba", "wnba", "ncaab", "ncaaw", "espn"], workers=8):
+        """
+        Generate m3u + xml for several leagues in one pass
 
-    def m3uESPN(self, terms="", tvg_cuid=1500):
-        """Generate m3u for ESPN PLUS Streams"""
-        m3u = "#EXTM3U\n"
-        for i, stream in enumerate(self.getStreamsESPN(terms=terms)):
-            tvg_id = stream.get("stream_id")
-            tvg_name = stream.get("name").split(":")[0].strip()
-            tvg_logo = "https://artwork.espncdn.com/programs/14ef54cc-6fd8-443d-80b8-365c1f64d606/16x9/large_20211213222642.jpg"
-            tvg_group = "ESPN+"
+        Categories are fetched once and every league's "get_live_streams" is fetched concurrently,
+        then each league renders from the prefetched data (no further provider round-trips).
 
-            m3u += f'#EXTINF:-1 CUID="{tvg_cuid}" tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
-            m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{tvg_id}\n')
-            tvg_cuid += 1
-        return m3u
+        ARGS:
+            leagues (list) - any of: "nfl", "nba", "wnba", "ncaab", "ncaaw", "espn"
+            workers (int) - max concurrent "get_live_streams" requests
+        Returns:
+            {"nfl": {"m3u": "#EXTM3U...", "xml": "<?xml..."}, ...}
+        """
+        builders = {
+            "nfl": ("NFL", self.m3uNFL, self.xmlNFL),
+            "nba": ("NBA", self.m3uNBA, self.xmlNBA),
+            "wnba": ("WNBA", self.m3uWNBA, self.xmlWNBA),
+            "ncaab": ("NCAA Men", self.m3uNCAAB, self.xmlNCAAB),
+            "ncaaw": ("NCAA Women", self.m3uNCAAW, self.xmlNCAAW),
+            "espn": ("ESPN", self.m3uESPN, self.xmlESPN),
+        }
+        self.CATEGORIES = self.fetchCategories()
+        category_ids = []
+        for league in leagues:
+            category = self.getCategory(query=builders[league][0])
+            if category and category["category_id"] not in category_ids:
+                category_ids.append(category["category_id"])
 
-    def xmlNFL(self):
-        """Generate xml for NFL Streams"""
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                self.STREAMS = dict(zip(category_ids, pool.map(self.fetchStreams, category_ids)))
+            return {league: {"m3u": builders[league][1](), "xml": builders[league][2]()} for league in leagues}
+        finally:
+            self.CATEGORIES = []
+            self.STREAMS = {}
+
+    def xmlNFL(self, stream=False):
+        """Generate xml for NFL Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         date_now = getEPGTimeNow(dt_obj=True)
+        try:
+            schedule = ScheduleIndex(self.espn.getNFLSchedule(), start="week_start", end="week_end")
+        except Exception as e:
+            print(e)
+            schedule = ScheduleIndex()
         for stream in self.getStreamsNFL():
             tvg_id = stream.get("stream_id")
             tvg_name = stream.get("name").split(":")[0].strip()
@@ -386,12 +428,10 @@ class KemoAPI(object):
                     try:
                         nfl_info = self.espn.parseNFLInfo(stream.get("name"))
                         ds_teams = [nfl_info["team1"], nfl_info["team2"]]
-                        df_sched = self.espn.getNFLSchedule()
-                        df_week = df_sched[((df_sched["week_start"] <= date_now) & (date_now <= df_sched["week_end"]))]
-                        df_game = df_week[(df_week["home_team"].isin(ds_teams) & df_week["away_team"].isin(ds_teams))].iloc[0]
+                        game = schedule.lookup(ds_teams, date_now)
 
-                        epg_title = f'{df_game.home_team} vs {df_game.away_team} at {df_game.home_venue}'
-                        epg_start = convertEPGTime(df_game.game_date, epg_fmt=True)
+                        epg_title = f'{game["home_team"]} vs {game["away_team"]} at {game["home_venue"]}'
+                        epg_start = convertEPGTime(game["game_date"], epg_fmt=True)
                         epg_stop = convertEPGTime(pd.to_datetime(epg_start) + pd.DateOffset(hours=3), epg_fmt=True)
                     except Exception as e:
                         print(e)
@@ -413,16 +453,20 @@ class KemoAPI(object):
             channels.append({"tvg_id": tvg_id, "tvg_name": tvg_name, "tvg_logo": tvg_logo, "epg_desc": epg_desc})
             programs.append({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop, "epg_desc": epg_desc})
 
-        # return gen_xmltv_xml(channels=channels, programs=programs, url=self.API_URL)
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
 
-    def xmlNBA(self):
-        """Generate xml NBA Streams"""
+    def xmlNBA(self, stream=False):
+        """Generate xml NBA Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         date_now = getEPGTimeNow(dt_obj=True)
+        dt_now = convertEPGTime(pd.to_datetime(date_now) - pd.DateOffset(hours=6), dt_obj=True)
+        try:
+            schedule = ScheduleIndex(self.nba.getNBASchedule())
+        except Exception as e:
+            print(e)
+            schedule = ScheduleIndex()
         for stream in self.getStreamsNBA():
             tvg_id = stream.get("stream_id")
             tvg_name = stream.get("name").split(":")[0].strip()
@@ -436,17 +480,10 @@ class KemoAPI(object):
                     try:
                         nba_info = self.nba.parseNBAInfo(stream.get("name"))
                         ds_teams = [nba_info["team1"], nba_info["team2"]]
-                        df_sched = self.nba.getNBASchedule()
-                        df_date = df_sched[((df_sched["day_start"] <= date_now) & (date_now <= df_sched["day_end"]))]
-                        try:
-                            df_game = df_date[(df_date["home_team"].isin(ds_teams) & df_date["away_team"].isin(ds_teams))].iloc[0]
-                        except Exception:
-                            dt_now = convertEPGTime(pd.to_datetime(date_now) - pd.DateOffset(hours=6), dt_obj=True)
-                            df_date = df_sched[((df_sched["day_start"] <= dt_now) & (dt_now <= df_sched["day_end"]))]
-                            df_game = df_date[(df_date["home_team"].isin(ds_teams) & df_date["away_team"].isin(ds_teams))].iloc[0]
-
-                        epg_title = f'{df_game.home_team} vs {df_game.away_team} at {df_game.home_venue}'
-                        epg_start = convertEPGTime(df_game.game_time, epg_fmt=True)
+                        game = schedule.lookup(ds_teams, date_now, dt_now)
+
+                        epg_title = f'{game["home_team"]} vs {game["away_team"]} at {game["home_venue"]}'
+                        epg_start = convertEPGTime(game["game_time"], epg_fmt=True)
                         epg_stop = convertEPGTime(pd.to_datetime(epg_start) + pd.DateOffset(hours=3), epg_fmt=True)
                     except Exception:
                         epg_title = stream.get("name") # "== PARSER FAILED =="
@@ -467,13 +504,11 @@ class KemoAPI(object):
             channels.append({"tvg_id": tvg_id, "tvg_name": tvg_name, "tvg_logo": tvg_logo, "epg_desc": epg_desc})
             programs.append({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop, "epg_desc": epg_desc})
 
-        # return gen_xmltv_xml(channels=channels, programs=programs, url=self.API_URL)
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
 
-    def xmlNCAAB(self):
-        """Generate NCAAB Streams"""
+    def xmlNCAAB(self, stream=False):
+        """Generate NCAAB Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         date_now = getEPGTimeNow(dt_obj=True)
@@ -507,13 +542,11 @@ class KemoAPI(object):
             channels.append({"tvg_id": tvg_id, "tvg_name": tvg_name, "tvg_logo": tvg_logo, "epg_desc": epg_desc})
             programs.append({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop, "epg_desc": epg_desc})
 
-        # return gen_xmltv_xml(channels=channels, programs=programs, url=self.API_URL)
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
 
-    def xmlNCAAW(self):
-        """Generate NCAAW Streams"""
+    def xmlNCAAW(self, stream=False):
+        """Generate NCAAW Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         date_now = getEPGTimeNow(dt_obj=True)
@@ -546,12 +579,11 @@ class KemoAPI(object):
             channels.append({"tvg_id": tvg_id, "tvg_name": tvg_name, "tvg_logo": tvg_logo, "epg_desc": epg_desc})
             programs.append({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop, "epg_desc": epg_desc})
 
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
 
-    def xmlESPN(self, terms=""):
-        """Generate xml NBA Streams"""
+    def xmlESPN(self, terms="", stream=False):
+        """Generate xml NBA Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         date_now = getEPGTimeNow(dt_obj=True).date()
@@ -576,17 +608,20 @@ class KemoAPI(object):
                         programs.append({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop, "epg_desc": epg_desc})
                 except Exception:
                     pass
-        # return gen_xmltv_xml(channels=channels, programs=programs, url=self.API_URL)
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
-
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
 
-    def xmlWNBA(self):
-        """Generate xml WNBA Streams"""
+    def xmlWNBA(self, stream=False):
+        """Generate xml WNBA Streams (stream=True returns a chunk generator)"""
         channels = []
         programs = []
         date_now = getEPGTimeNow(dt_obj=True)
+        dt_now = convertEPGTime(pd.to_datetime(date_now) - pd.DateOffset(hours=6), dt_obj=True)
+        try:
+            schedule = ScheduleIndex(self.espn.getWNBASchedule())
+        except Exception as e:
+            print(e)
+            schedule = ScheduleIndex()
         for stream in self.getStreamsWNBA():
             tvg_id = stream.get("stream_id")
             tvg_name = stream.get("name").split(":")[0].strip()
@@ -600,17 +635,10 @@ class KemoAPI(object):
                     try:
                         wnba_info = self.espn.parseWNBAInfo(stream.get("name"))
                         ds_teams = [wnba_info["team1"], wnba_info["team2"]]
-                        df_sched = self.espn.getWNBASchedule()
-                        df_date = df_sched[((df_sched["day_start"] <= date_now) & (date_now <= df_sched["day_end"]))]
-                        try:
-                            df_game = df_date[(df_date["home_team"].isin(ds_teams) & df_date["away_team"].isin(ds_teams))].iloc[0]
-                        except Exception:
-                            dt_now = convertEPGTime(pd.to_datetime(date_now) - pd.DateOffset(hours=6), dt_obj=True)
-                            df_date = df_sched[((df_sched["day_start"] <= dt_now) & (dt_now <= df_sched["day_end"]))]
-                            df_game = df_date[(df_date["home_team"].isin(ds_teams) & df_date["away_team"].isin(ds_teams))].iloc[0]
-
-                        epg_title = f'{df_game.home_team} vs {df_game.away_team} at {df_game.home_venue}'
-                        epg_start = convertEPGTime(df_game.game_time, epg_fmt=True)
+                        game = schedule.lookup(ds_teams, date_now, dt_now)
+
+                        epg_title = f'{game["home_team"]} vs {game["away_team"]} at {game["home_venue"]}'
+                        epg_start = convertEPGTime(game["game_time"], epg_fmt=True)
                         epg_stop = convertEPGTime(pd.to_datetime(epg_start) + pd.DateOffset(hours=3), epg_fmt=True)
                     except Exception:
                         epg_title = stream.get("name") # "== PARSER FAILED =="
@@ -631,7 +659,5 @@ class KemoAPI(object):
             channels.append({"tvg_id": tvg_id, "tvg_name": tvg_name, "tvg_logo": tvg_logo, "epg_desc": epg_desc})
             programs.append({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop, "epg_desc": epg_desc})
 
-        # return gen_xmltv_xml(channels=channels, programs=programs, url=self.API_URL)
-        url = furl(self.API_URL).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.API_URL).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
@@ -37,7 +37,7 @@ class LemoAPI:
         tvg_id = s["epg_channel_id"] if s.get("epg_channel_id") else ""
         tvg_name = s["name"] if s.get("name") else ""
         tvg_logo = s["stream_icon"] if s.get("stream_icon") else ""
-        tvg_group = next((c["category_name"] for c in self.cats if s["category_id"] == c["category_id"]), "")
+        tvg_group = self.cat_names.get(s["category_id"], "")
         return f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
 
     def genM3u(self, s):
@@ -97,6 +97,7 @@ class LemoAPI:
     def getM3U(self, extract_categories=False):
         self.streams = []
         self.cats = self.getCategories()
+        self.cat_names = {c["category_id"]: c["category_name"] for c in self.cats}
         return self.parseCategories(extract_categories)
 
     def validateM3U(self, m3u_file="/Users/katayama/Documents/MangoBoat/IP_TV_Stuff/KEMO_iPTV/lemo.m3u"):
@@ -1,5 +1,5 @@
 from .utils import to_csv, read_csv
-from .espn_api import ESPN_API
+from .espn_api import ESPN_API, getTeamMatcher, joinTeams, gameDays
 
 from nba_api.stats.static import teams as nba_teams
 from nba_api.stats.endpoints import leaguegamefinder
@@ -14,7 +14,6 @@ from furl import furl
 import pandas as pd
 import requests
 import json
-import re
 
 
 class NBA_API(object):
@@ -165,23 +164,19 @@ class NBA_API(object):
             for game_day in range(len(game_days)):
                 games += game_days[game_day]["games"]
 
-            schedule = []
-            for game in games:
-                game_time = pd.to_datetime(game["gameDateTimeUTC"]).tz_convert(tz='US/Eastern')
-                home = df_team[(df_team["team_id"] == game["homeTeam"]["teamId"])].squeeze()
-                away = df_team[(df_team["team_id"] == game["awayTeam"]["teamId"])].squeeze()
-                event = {
-                    "day_start":  game_time.replace(hour=0, minute=0, second=0),
-                    "day_end":    game_time.replace(hour=23, minute=59, second=59),
-                    "game_time":  game_time,
-                    "home_team":  "" if home.empty else home["team_name"] ,
-                    "home_venue": "" if home.empty else home["team_venue"],
-                    "away_team":  "" if away.empty else away["team_name"],
+            df_games = pd.DataFrame.from_records([
+                {
+                    "game_time":  game["gameDateTimeUTC"],
+                    "home_id":    game["homeTeam"]["teamId"],
+                    "away_id":    game["awayTeam"]["teamId"],
                 }
-                schedule.append(event)
-
-                df_schedule = pd.DataFrame.from_records(schedule)
-                to_csv(df_schedule, csv)
+                for game in games
+            ])
+            df_schedule = joinTeams(df_games, df_teams)
+            df_schedule["game_time"] = pd.to_datetime(df_schedule["game_time"], utc=True).dt.tz_convert('US/Eastern')
+            df_schedule["day_start"], df_schedule["day_end"] = gameDays(df_schedule["game_time"])
+            df_schedule = df_schedule[["day_start", "day_end", "game_time", "home_team", "home_venue", "away_team"]]
+            to_csv(df_schedule, csv)
 
         return df_schedule
 
@@ -207,9 +202,7 @@ class NBA_API(object):
         for line in tests:
             print(re.search(regex, line, flags=re.IGNORECASE).groupdict())
         """
-        nba_teams = "|".join(self.df_teams.team_name.values)
-        regex = rf'(?P<tvg_name>[\w\s]+)[:]\s+(?P<team1>({nba_teams}))[vsat\s]*(?P<team2>({nba_teams}))[\s@]+(?P<time>[\d:]+\s*[AMP]*)'
-        return re.search(regex, line, flags=re.IGNORECASE).groupdict()
+        return getTeamMatcher(tuple(self.df_teams.team_name), tuple(self.df_teams.team_nick)).parse(line)
 
 
 def testGetYear():
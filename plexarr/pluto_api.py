@@ -1,8 +1,6 @@
 # from teddy import getEPGTimeNow, convertEPGTime
-from .utils import getEPGTimeNow, convertEPGTime
+from .utils import getEPGTimeNow, convertEPGTime, XMLTVWriter
 from .chapo_api import ChapoAPI
-from pathlib import Path
-from bottle import template
 from furl import furl
 import pandas as pd
 import requests
@@ -69,8 +67,8 @@ class PlutoAPI(ChapoAPI):
         m3u += self.API_URL.replace('/player_api.php', f'/{self.USERNAME}/{self.PASSWORD}/{stream_id}\n')
         return m3u
 
-    def xmlScience(self):
-        """Generate EPG XML for Pluto Science"""
+    def xmlScience(self, stream=False):
+        """Generate EPG XML for Pluto Science (stream=True returns a chunk generator)"""
         channel_info, episodes = self.getChannel(term="science")
 
         channels = []
@@ -89,9 +87,8 @@ class PlutoAPI(ChapoAPI):
             programs.append({"tvg_id": tvg_id, "epg_title": epg_title, "epg_start": epg_start, "epg_stop": epg_stop,
                              "epg_desc": epg_desc, "epg_icon": epg_icon})
 
-        url = furl(self.api_pluto_url).origin
-        tpl = str(Path(__file__).parent.joinpath("templates/epg.tpl"))
-        return template(tpl, channels=channels, programs=programs, url=url)
+        xml = XMLTVWriter(url=furl(self.api_pluto_url).origin).iter(channels, programs)
+        return xml if stream else "".join(xml)
             
 # pluto = PlutoAPI()
 # pluto.xmlScience()
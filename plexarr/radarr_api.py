@@ -1,9 +1,141 @@
 import os
 import re
+import time
 from configparser import ConfigParser
+from datetime import datetime, timezone
 
 from .requests_api import RequestsAPI
-from .utils import camel_case
+from .utils import camel_case, normalize_title
+
+
+class RadarrIndex(object):
+    """
+    Local Movie Index for RadarrAPI Lookups
+
+    Movies are indexed by normalized (title, year), normalized title, tmdbId and imdbId.
+    refresh() re-indexes only movies whose added / lastModified / file fields changed, and
+    sync() re-reads just the movies Radarr's /history/since reports since the last sync.
+
+    Usage:
+        radarr = RadarrAPI()
+        movies = radarr.index.resolveMovies(["The Manifest (2017)", "Heat"])
+        movie = radarr.index.getMovie(imdb_id="tt0113277")
+    """
+    RE_YEAR = re.compile(r'^(?P<title>.*?)\s*\((?P<year>\d{4})\)\s*$')
+
+    def __init__(self, radarr, ttl=15 * 60):
+        """
+        Args:
+            Required - radarr (RadarrAPI) - client used for refreshes
+            Optional - ttl (int) - seconds before the /movie list is re-pulled
+        """
+        self.radarr = radarr
+        self.ttl = ttl
+        self.movies = {}
+        self.stamps = {}
+        self.keys = {}
+        self.titles = {}
+        self.tmdb = {}
+        self.imdb = {}
+        self.fetched = 0
+        self.synced = None
+
+    def stamp(self, movie):
+        """Fields that change when a movie is edited, re-titled or gets a new file"""
+        movie_file = movie.get("movieFile") or {}
+        return (movie.get("title"), movie.get("year"), movie.get("added"), movie.get("lastModified"),
+                movie_file.get("id"), movie_file.get("dateAdded"))
+
+    def add(self, movie):
+        """(Re-)index a single movie object"""
+        self.remove(movie["id"])
+        movie_id = movie["id"]
+        title = normalize_title(movie["title"])
+        self.movies[movie_id] = movie
+        self.stamps[movie_id] = self.stamp(movie)
+        self.keys[(title, movie.get("year"))] = movie_id
+        self.titles.setdefault(title, movie_id)
+        if movie.get("tmdbId"):
+            self.tmdb[movie["tmdbId"]] = movie_id
+        if movie.get("imdbId"):
+            self.imdb[movie["imdbId"]] = movie_id
+
+    def remove(self, movie_id):
+        """Drop a movie from every lookup table"""
+        movie = self.movies.pop(movie_id, None)
+        self.stamps.pop(movie_id, None)
+        if movie is None:
+            return
+        title = normalize_title(movie["title"])
+        for table, key in ((self.keys, (title, movie.get("year"))), (self.titles, title),
+                           (self.tmdb, movie.get("tmdbId")), (self.imdb, movie.get("imdbId"))):
+            if table.get(key) == movie_id:
+                del table[key]
+
+    def refresh(self, force=False):
+        """Re-pull /movie when stale (or forced); only changed / new / deleted movies are re-indexed"""
+        if not force and self.movies and (time.time() - self.fetched) < self.ttl:
+            return
+        movies = self.radarr.getMovies()
+        seen = set()
+        for movie in movies:
+            seen.add(movie["id"])
+            if self.stamps.get(movie["id"]) != self.stamp(movie):
+                self.add(movie)
+        for movie_id in set(self.movies) - seen:
+            self.remove(movie_id)
+        self.fetched = time.time()
+
+    def invalidate(self):
+        """Mark the /movie list stale so the next lookup re-pulls it (changed movies are re-indexed)"""
+        self.fetched = 0
+
+    def sync(self):
+        """
+        Incremental refresh from /history/since: only the movies touched since the last sync are re-read
+
+        The first call only records the sync point (refresh() covers the initial load).
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        if self.synced is not None:
+            records = self.radarr.get(path="/history/since", data={"date": self.synced})
+            for movie_id in {r["movieId"] for r in records if isinstance(r, dict) and r.get("movieId")}:
+                movie = self.radarr.getMovie(movie_id=movie_id)
+                if isinstance(movie, dict) and movie.get("id") is not None:
+                    self.add(movie)
+                else:
+                    self.remove(movie_id)
+        self.synced = now
+
+    def parse(self, title):
+        """"The Manifest (2017)" -> ("the manifest", 2017); no year -> (title, None)"""
+        m = self.RE_YEAR.match(title)
+        if m:
+            return normalize_title(m.group("title")), int(m.group("year"))
+        return normalize_title(title), None
+
+    def getMovie(self, title="", tmdb_id=-1, imdb_id=""):
+        """Movie object by title ("Title (Year)" or "Title"), tmdbId or imdbId (None when unknown)"""
+        self.refresh()
+        if tmdb_id >= 0:
+            return self.movies.get(self.tmdb.get(tmdb_id))
+        if imdb_id:
+            return self.movies.get(self.imdb.get(imdb_id))
+        key, year = self.parse(title)
+        movie_id = self.keys.get((key, year)) if year is not None else self.titles.get(key)
+        return self.movies.get(movie_id)
+
+    def resolveMovies(self, titles=[]):
+        """
+        Bulk title resolution: one (TTL-bound) library fetch, then dictionary lookups
+
+        Args:
+            Required - titles (list) - "Title (Year)" or "Title" strings (ex: download folder names)
+        Returns:
+            dict - {title: movie or None}
+        """
+        self.refresh()
+        return {title: self.getMovie(title=title) for title in titles}
 
 
 class RadarrAPI(RequestsAPI):
@@ -20,6 +152,7 @@ class RadarrAPI(RequestsAPI):
         self.api_url = config['radarr'].get('api_url')
         self.api_key = config['radarr'].get('api_key')
         super().__init__(api_url=self.api_url, api_key=self.api_key)
+        self.index = RadarrIndex(self)
 
     def getMovies(self):
         """Get all movies in the Radarr collection.
@@ -59,23 +192,8 @@ class RadarrAPI(RequestsAPI):
             return res
 
         if title:
-            movies = self.getMovies()
-            """
-            If the title contains year, then parse! [ex: "The Manifest (2017)"]
-            {
-                'title': 'The Manifest',
-                'year': '2017'
-            }
-            """
-            if re.search(r'\((?P<year>\d+)\)', title):
-                regex = r'(?P<title>.*(\s.+)*)\s\((?P<year>\d+)\)'
-                r = re.match(regex, title).groupdict()
-                title = r.get('title')
-                year = int(r.get('year'))
-                movie = next(filter(lambda x: x['title'] == title and x['year'] == year, movies), None)
-            else:
-                movie = next(filter(lambda x: x['title'] == title, movies), None)
-            return movie
+            # -- "The Manifest (2017)" matches on title + year, plain titles on title alone
+            return self.index.getMovie(title=title)
 
         return {'ERROR': 'A title or movie_id parameter is required'}
 
@@ -106,6 +224,8 @@ class RadarrAPI(RequestsAPI):
         path = f'/movie/{m_id}'
         data = movie_data
         res = self.put(path=path, data=data)
+        if isinstance(res, dict) and res.get("id") is not None and self.index.movies:
+            self.index.add(res)
         return res
 
     def getIndeexers(self):
@@ -144,12 +264,13 @@ class RadarrAPI(RequestsAPI):
         res = self.put(path=path, data=data)
         return res
 
-    def importDownloadedMovie(self, movie_path, **kwargs):
+    def importDownloadedMovie(self, movie_path, track=False, **kwargs):
         """Scan the provided movie_path for downloaded movie and import to Radarr collection
 
         Args:
             Required - movie_path (str) - Full path to downloaded movie (folder name should be the release name)
             Optional - import_mode (str) - "Move", "Copy", or "Hardlink" (default: "Move")
+            Optional - track (bool) - return a CommandHandle (see CommandHandle.wait()) instead of the JSON
         Returns:
             JSON Response
         """
@@ -161,7 +282,13 @@ class RadarrAPI(RequestsAPI):
         }
         data.update({camel_case(key): kwargs.get(key) for key in kwargs})
         res = self.post(path=path, data=data)
-        return res
+        self.index.invalidate()
+        return self.trackCommand(res) if track else res
+
+    def commandFinished(self, handle):
+        """Re-pull the movie index once a tracked import / rename has run (movie files changed)"""
+        if handle.command.get("name") in {"DownloadedMoviesScan", "RenameMovie", "RescanMovie"}:
+            self.index.invalidate()
 
     def getCommandStatus(self, cmd_id=None):
         path = f'/command/{cmd_id}'
@@ -1,7 +1,94 @@
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
+import asyncio
+import random
+import time
 import requests
 
 
+class CommandHandle(object):
+    """
+    Handle for a queued Sonarr/Radarr /command
+
+    Usage:
+        handle = sonarr.importDownloadedEpisode(path, track=True)
+        handle.wait(timeout=600)            # blocking, exponential backoff
+        await handle                        # asyncio (same as: await handle.waitAsync(timeout=600))
+        sonarr.waitCommands(handles)        # many commands, one /command list call per poll
+    """
+    DONE = {"completed", "failed", "aborted", "cancelled", "orphaned", "unknown"}
+
+    def __init__(self, api, command):
+        """
+        Args:
+            Required - api (RequestsAPI) - client that queued the command
+            Required - command (dict) - JSON response of the POST /command
+        """
+        self.api = api
+        self.command = command
+        self.id = command.get("id")
+        self.submitted = time.time()
+        self.finished = None
+
+    def __repr__(self):
+        return f'<CommandHandle {self.command.get("name")} id={self.id} status={self.status}>'
+
+    @property
+    def status(self):
+        return self.command.get("status")
+
+    @property
+    def done(self):
+        return self.status in self.DONE
+
+    @property
+    def ok(self):
+        return self.status == "completed"
+
+    def update(self, command):
+        """Store a newer /command record for this handle"""
+        self.command = command
+        if self.done and self.finished is None:
+            self.finished = time.time()
+            self.api.commandFinished(self)
+
+    def refresh(self):
+        """Re-read this command's status (one GET /command/{id})
+
+        A 404 / unparsable reply or a record without a status means Sonarr/Radarr no longer knows the
+        command (ex: purged after a restart), so it is marked "unknown" and no longer polled.
+        """
+        if not self.done:
+            try:
+                command = self.api.get(path=f"/command/{self.id}")
+            except ValueError:
+                command = None
+            if not isinstance(command, dict) or not command.get("status"):
+                command = dict(self.command, status="unknown")
+            self.update(command)
+        return self
+
+    def wait(self, timeout=None, initial=0.5, maximum=10.0, factor=2.0):
+        """Block until the command finishes, polling with exponential backoff; returns the final record"""
+        self.api.waitCommands([self], timeout=timeout, initial=initial, maximum=maximum, factor=factor)
+        return self.command
+
+    async def waitAsync(self, timeout=None, initial=0.5, maximum=10.0, factor=2.0):
+        """asyncio version of wait() (the HTTP call runs in the default executor)"""
+        loop = asyncio.get_running_loop()
+        delay, deadline = initial, None if timeout is None else time.time() + timeout
+        while not self.done:
+            await loop.run_in_executor(None, self.refresh)
+            if self.done or (deadline is not None and time.time() >= deadline):
+                break
+            await asyncio.sleep(delay)
+            delay = min(maximum, delay * factor)
+        return self.command
+
+    def __await__(self):
+        return self.waitAsync().__await__()
+
+
 class RequestsAPI:
     """Wrapper for requests()
     """
@@ -33,24 +120,30 @@ class RequestsAPI:
         res = self.session.get(url=url, headers=self.headers, params=data)
         return res.json()
 
-    def post(self, path, data={}):
+    def post(self, path, data={}, check=False):
         """Wrapper on session.get()
         Args:
             path: The endpoint for API
             data: Parameters to pass in dict() format
+            check: raise requests.HTTPError on a 4xx/5xx status (ex: inside bulk() so failures are retried)
         """
         url = urljoin(self.api_url, path.strip('/'))
         res = self.session.post(url=url, headers=self.headers, json=data)
+        if check:
+            res.raise_for_status()
         return res.json()
 
-    def put(self, path, data={}):
+    def put(self, path, data={}, check=False):
         """Wrapper on session.get()
         Args:
             path: The endpoint for API
             data: Parameters to pass in dict() format
+            check: raise requests.HTTPError on a 4xx/5xx status (ex: inside bulk() so failures are retried)
         """
         url = urljoin(self.api_url, path.strip('/'))
         res = self.session.put(url=url, headers=self.headers, json=data)
+        if check:
+            res.raise_for_status()
         return res.json()
 
     def delete(self, path):
@@ -62,3 +155,99 @@ class RequestsAPI:
         url = urljoin(self.api_url, path.strip('/'))
         res = self.session.delete(url=url, headers=self.headers)
         return res.json()
+
+    def bulk(self, func, items, workers=8, retries=2, backoff=0.5, idempotent=True):
+        """Run func(item) for many items on a bounded thread pool, retrying failures with backoff
+
+        Idempotent requests (GET/PUT) are retried on any request error or unreadable body. Anything else
+        (ex: POST /command) is only retried when the server cannot have acted on it: the connection was never
+        made, or a gateway answered 502/503 for it.
+
+        Args:
+            Required - func (callable) - request for a single item, raising on HTTP errors
+                                         (ex: lambda e: self.put(f'/Episode/{e["id"]}', e, check=True))
+            Required - items (list) - one entry per request
+            Optional - workers (int) - requests in flight
+            Optional - retries (int) - attempts after the first for an item that raised
+            Optional - backoff (float) - base seconds for exponential backoff
+            Optional - idempotent (bool) - False for requests that must not run twice (ex: POST)
+        Returns:
+            List aligned with items: the JSON response, or the exception of the last attempt
+        """
+        def retryable(e):
+            if idempotent:
+                return True
+            if isinstance(e, requests.HTTPError):
+                return e.response is not None and e.response.status_code in (502, 503)
+            return isinstance(e, requests.ConnectionError) and not isinstance(e, requests.ReadTimeout)
+
+        def run(item):
+            for attempt in range(retries + 1):
+                try:
+                    return func(item)
+                except (requests.RequestException, ValueError) as e:
+                    if attempt == retries or not retryable(e):
+                        return e
+                    time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run, items))
+
+    def trackCommand(self, command):
+        """Wrap a POST /command response in a CommandHandle"""
+        return CommandHandle(self, command)
+
+    def commandFinished(self, handle):
+        """Called once when a tracked command reaches a final status (subclasses drop stale caches here)"""
+
+    def waitCommands(self, handles, timeout=None, initial=0.5, maximum=10.0, factor=2.0):
+        """Wait for many commands, checking all of them with one GET /command per poll
+
+        Commands the list no longer reports are checked individually. Polls start at "initial" seconds
+        and back off by "factor" up to "maximum" (reset whenever a command finishes).
+
+        Args:
+            Required - handles (list) - CommandHandle objects (see trackCommand())
+            Optional - timeout (int) - seconds to give up after (None: wait forever)
+        Returns:
+            dict - throughput metrics (also kept on self.command_stats)
+        """
+        start = time.time()
+        deadline = None if timeout is None else start + timeout
+        delay, polls, requests_made = initial, 0, 0
+        pending = {h.id: h for h in handles if not h.done and h.id is not None}
+        while pending:
+            commands = self.get(path="/command")
+            polls, requests_made = polls + 1, requests_made + 1
+            listed = {c.get("id"): c for c in commands} if isinstance(commands, list) else {}
+            finished = 0
+            for command_id, handle in list(pending.items()):
+                if command_id in listed:
+                    handle.update(listed[command_id])
+                else:
+                    handle.refresh()
+                    requests_made += 1
+                if handle.done:
+                    finished += 1
+                    del pending[command_id]
+            if not pending or (deadline is not None and time.time() >= deadline):
+                break
+            delay = initial if finished else min(maximum, delay * factor)
+            time.sleep(delay if deadline is None else max(0, min(delay, deadline - time.time())))
+
+        elapsed = time.time() - start
+        done = [h for h in handles if h.done]
+        durations = [h.finished - h.submitted for h in done if h.finished]
+        self.command_stats = {
+            "commands": len(handles),
+            "completed": sum(h.ok for h in done),
+            "failed": sum(h.status != "unknown" and not h.ok for h in done),
+            "unknown": sum(h.status == "unknown" for h in done),
+            "pending": len(handles) - len(done),
+            "polls": polls,
+            "requests": requests_made,
+            "elapsed": round(elapsed, 3),
+            "per_minute": round(len(done) / elapsed * 60, 2) if elapsed else float(len(done)),
+            "avg_duration": round(sum(durations) / len(durations), 3) if durations else None,
+        }
+        return self.command_stats
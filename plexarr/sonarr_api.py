@@ -1,11 +1,137 @@
 from typing import Any
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
+from itertools import chain
+from datetime import datetime, timezone
 from pathlib import Path
+import time
 
+import pandas as pd
+import requests
 from rich.console import Console
 
 from .requests_api import RequestsAPI
-from .utils import camel_case
+from .utils import camel_case, normalize_title
+
+
+class SonarrIndex(object):
+    """
+    Local Series / Episode Index for SonarrAPI Lookups
+
+    Series are indexed by id, normalized title and tvdbId; episodes by (series_id, season, episode).
+    The series list is re-pulled after series_ttl, each show's episodes after episodes_ttl, and
+    sync() drops just the shows that Sonarr's history reports as changed since the last sync.
+
+    Title lookups are normalized (see normalize_title()): case, accents, "&" vs "and" and punctuation
+    are ignored, so "the office us" finds "The Office (US)". Before the index, getShow(title=...)
+    only matched the exact title. A re-indexed show is found by its current title only.
+
+    Usage:
+        sonarr = SonarrAPI()
+        show = sonarr.index.getShow(title="The Office (US)")
+        episode = sonarr.index.getEpisode(title="The Office (US)", s_num=2, e_num=1)
+        sonarr.index.sync()     # ex: at the start of each import run
+    """
+
+    def __init__(self, sonarr, series_ttl=15 * 60, episodes_ttl=5 * 60):
+        """
+        Args:
+            Required - sonarr (SonarrAPI) - client used for refreshes
+            Optional - series_ttl (int) - seconds before the /series list is re-pulled
+            Optional - episodes_ttl (int) - seconds before a show's episodes are re-pulled
+        """
+        self.sonarr = sonarr
+        self.series_ttl = series_ttl
+        self.episodes_ttl = episodes_ttl
+        self.series = {}
+        self.titles = {}
+        self.tvdb = {}
+        self.episodes = {}
+        self.series_fetched = 0
+        self.episodes_fetched = {}
+        self.synced = None
+
+    def refresh(self, force=False):
+        """Re-pull /series when stale (or forced) and rebuild the lookup tables"""
+        if not force and self.series and (time.time() - self.series_fetched) < self.series_ttl:
+            return
+        self.series, self.titles, self.tvdb = {}, {}, {}
+        for show in self.sonarr.getSeries():
+            self.add(show)
+        self.series_fetched = time.time()
+
+    def add(self, show):
+        """(Re-)index a single series object"""
+        self.remove(show["id"])
+        self.series[show["id"]] = show
+        self.titles[normalize_title(show["title"])] = show["id"]
+        if show.get("tvdbId"):
+            self.tvdb[show["tvdbId"]] = show["id"]
+
+    def remove(self, series_id):
+        """Drop a series from every lookup table (keys now owned by another series are kept)"""
+        show = self.series.pop(series_id, None)
+        if show is None:
+            return
+        for table, key in ((self.titles, normalize_title(show["title"])), (self.tvdb, show.get("tvdbId"))):
+            if table.get(key) == series_id:
+                del table[key]
+
+    def invalidate(self, series_id=None):
+        """Forget cached episodes for one show (or all shows)"""
+        if series_id is None:
+            self.episodes, self.episodes_fetched = {}, {}
+        else:
+            self.episodes.pop(series_id, None)
+            self.episodes_fetched.pop(series_id, None)
+
+    def sync(self):
+        """
+        Incremental refresh from /history/since: changed shows are re-read and their episodes dropped
+
+        The first call only records the sync point (refresh() covers the initial load).
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        if self.synced is not None:
+            records = self.sonarr.get(path="/history/since", data={"date": self.synced})
+            for series_id in {r["seriesId"] for r in records if isinstance(r, dict) and r.get("seriesId")}:
+                self.invalidate(series_id)
+                show = self.sonarr.getShow(series_id=series_id)
+                if isinstance(show, dict) and show.get("id") is not None:
+                    self.add(show)
+                else:
+                    self.remove(series_id)
+        self.synced = now
+
+    def getSeriesID(self, title="", tvdb_id=-1):
+        """series_id for a title (normalized match) or tvdbId, or None"""
+        self.refresh()
+        if tvdb_id >= 0:
+            return self.tvdb.get(tvdb_id)
+        return self.titles.get(normalize_title(title))
+
+    def getShow(self, title="", series_id=-1, tvdb_id=-1):
+        """Series object by title, series_id or tvdbId (None when unknown)"""
+        self.refresh()
+        if series_id < 0:
+            series_id = self.getSeriesID(title=title, tvdb_id=tvdb_id)
+        return self.series.get(series_id)
+
+    def getEpisodes(self, title="", series_id=-1, force=False):
+        """{(season, episode): episode} for a show, from cache while younger than episodes_ttl (unless forced)"""
+        if series_id < 0:
+            series_id = self.getSeriesID(title=title)
+        if series_id is None:
+            return {}
+        if force or (time.time() - self.episodes_fetched.get(series_id, 0)) >= self.episodes_ttl:
+            episodes = self.sonarr.get(path="/Episode", data={"seriesId": series_id})
+            self.episodes[series_id] = {(e["seasonNumber"], e["episodeNumber"]): e for e in episodes}
+            self.episodes_fetched[series_id] = time.time()
+        return self.episodes[series_id]
+
+    def getEpisode(self, title="", series_id=-1, s_num=-1, e_num=-1, force=False):
+        """Episode object by (show, season, episode) (None when unknown)"""
+        return self.getEpisodes(title=title, series_id=series_id, force=force).get((int(s_num), int(e_num)))
 
 
 class SonarrAPI(RequestsAPI):
@@ -23,6 +149,7 @@ class SonarrAPI(RequestsAPI):
         self.api_url = config['sonarr'].get('api_url')
         self.api_key = config['sonarr'].get('api_key')
         super().__init__(api_url=self.api_url, api_key=self.api_key)
+        self.index = SonarrIndex(self)
 
     def getSeries(self):
         """Get all series in the Sonarr collection
@@ -38,7 +165,7 @@ class SonarrAPI(RequestsAPI):
         """Get a tv_show from the Sonarr collection by title or series_id
 
         Args:
-            Optional - title (str) - The title of the TV Show
+            Optional - title (str) - The title of the TV Show (normalized match, see SonarrIndex)
             Optional - series_id (int) - The Sonarr series_id
         Returns:
             JSON Object
@@ -51,9 +178,7 @@ class SonarrAPI(RequestsAPI):
             return res
 
         if title:
-            series = self.getSeries()
-            show = next(filter(lambda x: x['title'] == title, series), None)
-            return show
+            return self.index.getShow(title=title)
 
         return {'ERROR': 'A title or series_id parameter is required'}
 
@@ -100,9 +225,9 @@ class SonarrAPI(RequestsAPI):
             data["includeImages"] = True
 
         if title:
-            series = self.getSeries()
-            show = next(filter(lambda x: x['title'] == title, series), None)
-            data['seriesId'] = show.get('id', '')
+            data['seriesId'] = self.index.getSeriesID(title=title)
+            if data['seriesId'] is None:
+                return {'ERROR': f'Series not found: {title}'}
 
         path = '/Episode'
         res = self.get(path=path, data=data)
@@ -114,8 +239,7 @@ class SonarrAPI(RequestsAPI):
         e_num = int(e_num)
 
         if ((s_num >= 0) and (e_num >= 0) and (title)):
-            ep_all = self.getEpisodes(title=title)
-            return next(filter(lambda x: x['seasonNumber'] == s_num and x['episodeNumber'] == e_num, ep_all), None)
+            return self.index.getEpisode(title=title, s_num=s_num, e_num=e_num)
 
         if (episode_file_id >= 0):
             path = f'/EpisodeFile/{episode_file_id}'
@@ -136,9 +260,9 @@ class SonarrAPI(RequestsAPI):
         """
         data = {}
         if title:
-            series = self.getSeries()
-            show = next(filter(lambda x: x['title'] == title, series), None)
-            series_id = show.get('id')
+            series_id = self.index.getSeriesID(title=title)
+            if series_id is None:
+                return {'ERROR': f'Series not found: {title}'}
 
         if (series_id >= 0):
             data['seriesId'] = series_id
@@ -156,9 +280,11 @@ class SonarrAPI(RequestsAPI):
         e_num = int(e_num)
 
         if ((s_num >= 0) and (e_num >= 0) and (title)):
-            ep_all = self.getEpisodes(title=title)
-            ep_info = next(filter(lambda x: x['seasonNumber'] == s_num and x['episodeNumber'] == e_num, ep_all), {})
-            episode_file_id = ep_info["episodeFileId"]
+            # -- file state changes with every import, so skip the cached episodes
+            ep_info = self.index.getEpisode(title=title, s_num=s_num, e_num=e_num, force=True) or {}
+            episode_file_id = ep_info.get("episodeFileId") or -1
+            if episode_file_id < 0:
+                return {'ERROR': f'No episode file for: {title} S{s_num:02d}E{e_num:02d}'}
 
         path = f'/EpisodeFile/{episode_file_id}'
         res = self.get(path=path)
@@ -175,6 +301,8 @@ class SonarrAPI(RequestsAPI):
         path = '/Episode'
         data = episodes_data
         res = self.put(path=path, data=data)
+        for series_id in {e.get('seriesId') for e in episodes_data}:
+            self.index.invalidate(series_id)
         return res
 
 
@@ -189,6 +317,7 @@ class SonarrAPI(RequestsAPI):
         path = f'/Episode/{episode_id}'
         data = episode_data
         res = self.put(path=path, data=data)
+        self.index.invalidate(episode_data.get('seriesId'))
         return res
 
 
@@ -203,8 +332,68 @@ class SonarrAPI(RequestsAPI):
         path = f"/EpisodeFile/{episode_file_id}"
         data = episode_file_data
         res = self.put(path=path, data=data)
+        self.index.invalidate(episode_file_data.get('seriesId'))
+        return res
+
+    def monitorEpisodes(self, episode_ids: list[int], monitored: bool = True) -> Any:
+        """Set monitored on many episodes with one request (Sonarr's /episode/monitor endpoint)
+
+        Args:
+            Required - episode_ids (list) - IDs of the Episodes
+            Optional - monitored (bool) - new monitored state (default: True)
+        Returns:
+            JSON Response
+        """
+        path = '/episode/monitor'
+        data = {'episodeIds': episode_ids, 'monitored': monitored}
+        res = self.put(path=path, data=data, check=True)
+        self.index.invalidate()
         return res
 
+    def editEpisodesBulk(self, episodes_data: list[dict[str, Any]], workers: int = 8, retries: int = 2) -> list:
+        """Edit many Episodes concurrently (one PUT per episode, bounded pool, retried)
+
+        Args:
+            Required - episodes_data [dict] - Episode objects with changes (do getEpisodes() first)
+            Optional - workers (int) - requests in flight
+            Optional - retries (int) - attempts after the first for a failing episode
+        Returns:
+            List aligned with episodes_data: JSON Response or the exception raised
+        Note:
+            for monitored-only changes monitorEpisodes() is a single request
+        """
+        def edit(episode):
+            return self.put(path=f'/Episode/{episode["id"]}', data=episode, check=True)
+
+        res = self.bulk(edit, episodes_data, workers=workers, retries=retries)
+        for series_id in {e.get('seriesId') for e in episodes_data}:
+            self.index.invalidate(series_id)
+        return res
+
+    def editEpisodeFilesBulk(self, episode_files_data: list[dict[str, Any]], workers: int = 8,
+                             retries: int = 2) -> list:
+        """Edit many Episode Files: Sonarr's /episodefile/bulk endpoint when available, else concurrent PUTs
+
+        Args:
+            Required - episode_files_data [dict] - Episode File objects with changes
+            Optional - workers (int) - requests in flight for the fallback
+            Optional - retries (int) - attempts after the first for a failing file
+        Returns:
+            List of JSON Responses (or exceptions for files that kept failing)
+        """
+        def edit(episode_file):
+            return self.put(path=f'/EpisodeFile/{episode_file["id"]}', data=episode_file, check=True)
+
+        try:
+            res = self.put(path='/episodefile/bulk', data=episode_files_data, check=True)
+        except (requests.RequestException, ValueError):
+            res = None
+        if not isinstance(res, list):
+            # -- older Sonarr: no bulk endpoint
+            res = self.bulk(edit, episode_files_data, workers=workers, retries=retries)
+        for series_id in {f.get('seriesId') for f in episode_files_data}:
+            self.index.invalidate(series_id)
+        return res
 
     def getIndexers(self):
         """Get a list of all Download Indexers
@@ -242,17 +431,23 @@ class SonarrAPI(RequestsAPI):
         res = self.put(path=path, data=data)
         return res
 
+    def commandFinished(self, handle):
+        """Drop cached episodes once a tracked import / rename has run (their episodeFileIds changed)"""
+        if handle.command.get("name") in {"DownloadedEpisodesScan", "RenameSeries", "RescanSeries"}:
+            self.index.invalidate()
+
     def getCommandStatus(self, cmd_id=None):
         path = f'/command/{cmd_id}'
         res = self.get(path=path)
         return res
 
-    def importDownloadedEpisode(self, episode_path: str, **kwargs):
+    def importDownloadedEpisode(self, episode_path: str, track: bool = False, **kwargs):
         """Scan the provided episode_path for downloaded episode and import to Sonarr collection
 
         Args:
             Required - episode_path (str) - Full path to downloaded episode (folder name should be {release name}/{Season #})
             Optional - import_mode (str) - "Move", "Copy", or "Hardlink" (default: "Move")
+            Optional - track (bool) - return a CommandHandle (see CommandHandle.wait()) instead of the JSON
         Returns:
             JSON Response
         """
@@ -264,13 +459,41 @@ class SonarrAPI(RequestsAPI):
         }
         data.update({camel_case(key): kwargs.get(key) for key in kwargs})
         res = self.post(path=path, data=data)
+        self.index.invalidate()
+        return self.trackCommand(res) if track else res
+
+    def importDownloadedEpisodes(self, episode_paths: list[str], workers: int = 8, retries: int = 2,
+                                 **kwargs) -> list:
+        """Queue a DownloadedEpisodesScan for every path concurrently
+
+        Args:
+            Required - episode_paths (list) - Full paths to downloaded episodes (see importDownloadedEpisode())
+            Optional - workers (int) - requests in flight
+            Optional - retries (int) - attempts after the first for a path whose POST never reached Sonarr
+            Optional - import_mode (str) - "Move", "Copy", or "Hardlink" (default: "Move")
+        Returns:
+            List aligned with episode_paths: command JSON Response or the exception raised
+        """
+        path = '/command'
+        data = {
+            'name': 'DownloadedEpisodesScan',
+            'importMode': 'Move'
+        }
+        data.update({camel_case(key): kwargs.get(key) for key in kwargs})
+
+        def scan(episode_path):
+            return self.post(path=path, data=dict(data, path=episode_path), check=True)
+
+        res = self.bulk(scan, episode_paths, workers=workers, retries=retries, idempotent=False)
+        self.index.invalidate()
         return res
 
-    def renameSeries(self, series_ids: list, **kwargs):
+    def renameSeries(self, series_ids: list, track: bool = False, **kwargs):
         """Instruct Sonarr to rename all files in the provided series.
 
         Args:
             Required - series_ids (list) - List of Series IDs to rename
+            Optional - track (bool) - return a CommandHandle (see CommandHandle.wait()) instead of the JSON
         Returns:
             JSON Response
         """
@@ -281,7 +504,7 @@ class SonarrAPI(RequestsAPI):
         }
         data.update({camel_case(key): kwargs.get(key) for key in kwargs})
         res = self.post(path=path, data=data)
-        return res
+        return self.trackCommand(res) if track else res
 
     def getHistory(self, sort_key: str, **kwargs):
         """Get Download History (grabs / failures / completed)
@@ -299,47 +522,77 @@ class SonarrAPI(RequestsAPI):
         res = self.get(path=path, data=data)
         return res
 
-    def getIndexerStats(self):
+    def iterHistory(self, sort_key: str = "date", page_size: int = 250, workers: int = 1, since_id: int = -1,
+                    **kwargs):
+        """Walk /history page by page, yielding records as each page arrives
+
+        Args:
+            Optional - sort_key (str) - "date" (default), "series.title", ...
+            Optional - page_size (int) - records per request
+            Optional - workers (int) - pages fetched concurrently (pages are still yielded in order)
+            Optional - since_id (int) - newest first, stopping at the first record with id <= since_id
+            Optional - kwargs - other /history filters (ex: event_type=1, sort_direction="ascending")
+        Returns:
+            Generator of history records
+        """
+        if since_id >= 0:
+            kwargs["sort_direction"] = "descending"
+            workers = 1
+
+        def page(num):
+            return self.getHistory(sort_key=sort_key, page=num, page_size=page_size, **kwargs)
+
+        first = page(1)
+        pages = -(-first.get("totalRecords", 0) // page_size)
+        results = iter([first])
+        if pages > 1:
+            if workers > 1:
+                executor = ThreadPoolExecutor(max_workers=workers)
+                results = chain(results, executor.map(page, range(2, pages + 1)))
+            else:
+                results = chain(results, (page(num) for num in range(2, pages + 1)))
+        try:
+            for result in results:
+                for record in result.get("records", []):
+                    if since_id >= 0 and record["id"] <= since_id:
+                        return
+                    yield record
+        finally:
+            if workers > 1 and pages > 1:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def getIndexerStats(self, since_id: int = -1, page_size: int = 250, workers: int = 4):
         """Get Indexer Stats (grabs)
         Args:
-            None
+            Optional - since_id (int) - only grabs newer than this history id (see self.history_last_id)
+            Optional - page_size (int) - records per /history request
+            Optional - workers (int) - pages fetched concurrently for full runs
         Returns:
-            DICT Array
+            DataFrame (date, indexer, release_groups, quality, resolution, source_types), oldest first
         """
-        query = self.getHistory(
+        columns = ["id", "date", "indexer", "release_groups", "quality", "resolution", "source_types"]
+        records = self.iterHistory(
             sort_key="date",
-            page=1,
-            page_size=10,
-            sort_direction="ascending",
-            event_type=1
-        )
-        page_size = round(query["totalRecords"] / 10) * 10
-        results = self.getHistory(
-            sort_key="date",
-            page=1,
             page_size=page_size,
+            workers=workers,
+            since_id=since_id,
             sort_direction="ascending",
             event_type=1
         )
-        dates = []
-        indexers = []
-        release_groups = []
-        qualities = []
-        resolutions = []
-        source_types = []
-        for record in results["records"]:
-            dates.append(record["date"])
-            indexers.append(record["data"]["indexer"])
-            release_groups.append(record["data"]["releaseGroup"])
-            qualities.append(record["quality"]["quality"]["name"])
-            resolutions.append(record["quality"]["quality"]["resolution"])
-            source_types.append(record["quality"]["quality"]["source"])
-        return {
-            "date": dates,
-            "indexer": indexers,
-            "release_groups": release_groups,
-            "quality": qualities,
-            "resolution": resolutions,
-            "source_types": source_types,
-        }
-
+        rows = (
+            (
+                record["id"],
+                record["date"],
+                record["data"].get("indexer"),
+                record["data"].get("releaseGroup"),
+                record["quality"]["quality"]["name"],
+                record["quality"]["quality"]["resolution"],
+                record["quality"]["quality"]["source"],
+            )
+            for record in records
+        )
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        df = df.sort_values(["date", "id"], ignore_index=True)
+        # -- pass back as since_id on the next run for an incremental update
+        self.history_last_id = int(df["id"].max()) if len(df) else since_id
+        return df.drop(columns="id")
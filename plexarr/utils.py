@@ -1,8 +1,15 @@
 import xmltodict
+from lxml import etree
+from xml.sax.saxutils import escape
 import json
 import re
 
 from datetime import datetime as dt
+from functools import lru_cache
+from itertools import chain
+from array import array
+from collections import deque
+from zoneinfo import ZoneInfo
 from pathlib import Path
 from furl import furl
 import urllib.request
@@ -15,14 +22,20 @@ import pandas as pd
 from contextlib import contextmanager
 from ipaddress import ip_address
 import traceback
+import threading
+import zlib
+import heapq
+import bisect
+import gzip
+import io
+import calendar
+import sqlite3
+import hashlib
+import unicodedata
 import time
 import socket
 import select
 
-import m3u8
-from m3u8 import protocol
-from m3u8.parser import save_segment_custom_value
-
 from logging.handlers import TimedRotatingFileHandler
 from logging import StreamHandler
 from coloredlogs import ColoredFormatter, find_program_name, ProgramNameFilter
@@ -74,6 +87,13 @@ def camel_case(s):
     return ''
 
 
+def normalize_title(title):
+    """Lookup key for a show/movie title: case, accents, "&"/"and" and punctuation are ignored"""
+    title = unicodedata.normalize("NFKD", str(title)).encode("ascii", "ignore").decode().lower()
+    title = re.sub(r"\s*&\s*", " and ", title)
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", title).split())
+
+
 def gen_xmltv_xml(channels=[], programs=[], url=''):
     """Template for generating XMLTV TV Guide!.
 
@@ -81,7 +101,7 @@ def gen_xmltv_xml(channels=[], programs=[], url=''):
         Required - channels (list) - List of channel objects
         Required - programs (list) - List of program objects
     Returns:
-        XMLTV String
+        XMLTV String (see XMLTVWriter to stream it instead)
     Required Object Format:
         channel - {
             "tvg_id": tvg_id,
@@ -97,141 +117,138 @@ def gen_xmltv_xml(channels=[], programs=[], url=''):
             "epg_desc": epg_desc
         }
     """
+    return "".join(XMLTVWriter(url=furl(url).origin).iter(channels, programs))
 
-    xml_header = f"""\
-<?xml version="1.0" encoding="utf-8" ?>
-<!DOCTYPE tv SYSTEM "xmltv.dtd">
-<tv generator-info-name="IPTV" generator-info-url="{furl(url).origin}">
-"""
-
-    xml_channels = ""
-    for channel in channels:
-        tvg_id, tvg_name, tvg_logo, epg_desc = channel.values()
-        xml_channels += f"""\
-    <channel id="{tvg_id}">
-        <display-name>{tvg_name}</display-name>
-        <icon src="{tvg_logo}"/>
-    </channel>
-"""
-
-    xml_programs = ""
-    for program in programs:
-        if len(program.values()) == 5:
-            tvg_id, epg_title, epg_start, epg_stop, epg_desc = program.values()
-        else:
-            tvg_id, epg_title, epg_start, epg_stop, epg_desc, epg_icon = program.values()
-        xml_programs += f"""\
-    <programme channel="{tvg_id}" start="{epg_start}" stop="{epg_stop}">'
-        <title lang="en">{epg_title}</title>'
-        <desc lang="en">{epg_desc}</desc>'
-    </programme>'
-"""
 
-    xml_footer = """\
-</tv>
-"""
+def m3u_to_json(src):
+    """
+    Playlist -> JSON string (legacy layout: header "url_tvg" / "x_tvg_url" + "streams" with snake_case keys)
 
-    xmltv = xml_header + xml_channels + xml_programs + xml_footer
-    return xmltv
+    Built on iter_m3u(), so extra "#EXTVLCOPT" / "#EXTGRP" lines cannot shift entries.
+    """
+    header = {}
+    streams = [m3u_json_record(stream) for stream in iter_m3u(src, header=header)]
+    info = {k.replace("-", "_"): v for k, v in header.items() if k in ("url-tvg", "x-tvg-url")}
+    return json.dumps(dict(info, streams=streams))
 
 
-def m3u_to_json(src):
-    # -- cleanup excess new-lines
-    src = re.sub(r'\n+', '\n', src.strip())
-    temp = src.splitlines()
-    temp_info = temp.pop(0)
-
-    # -- handle lemo xui m3u with extra line of info
-    extra_info = []
-    for i, tmp in enumerate(temp):
-        if not tmp.startswith(('#EXTINF', 'http')):
-            extra_info.append(tmp)
-        else:
-            break
-    temp = temp[i:]
+def m3u_json_record(stream):
+    """iter_m3u() record -> m3u_to_json() stream layout"""
+    record = {"ext_inf": str(stream["duration"])}
+    record.update(
+        (k.replace("-", "_"), v) for k, v in stream.items() if k not in ("title", "duration", "url", "stream_id")
+    )
+    record.update(chan_name=stream["title"], stream_url=stream["url"])
+    return {k: v for k, v in record.items() if v}
 
-    data = {}
-    regex_info = r"""
-        #EXTM3U url-tvg="(?P<url_tvg>.*)" x-tvg-url="(?P<x_tvg_url>.*)"   |
-        #EXTM3U(.*)
-    """
-    info = re.search(regex_info, temp_info, re.VERBOSE).groupdict()
-    data.update(info)
 
-    streams = []
-    regex_stream = r"""
-        [#]EXTINF:(?P<ext_inf>(\d|-)+)                          | # TODO
-        channelID=["](?P<channelID>[^"]+)["]     | # Channel ID
-        tvg-chno=["](?P<tvg_chno>[^"]+)["]       | # TVG Number
-        tvg-name=["](?P<tvg_name>[^"]+)["]       | # TVG Name
-        tvg-id=["](?P<tvg_id>[^"]+)["]           | # TVG ID
-        tvg-logo=["](?P<tvg_logo>[^"]+)["]       | # TVG LOGO
-        group-title=["](?P<group_title>[^"]+)["] | # Group Title
-        ,(?P<chan_name>.*)                       | # Channel Name == TVG Name
-        (?P<stream_url>(http://\d+.\d+.\d+.\d+\:\d+/stream/.*))
-    """
-    r_stream = re.compile(regex_stream, re.VERBOSE)
-    for line in list(map("\n".join, zip(temp[0::2], temp[1::2]))):
-        streams.append(
-            {
-                k: v
-                for m in r_stream.finditer(line)
-                for k, v in m.groupdict().items()
-                if v
-            }
-        )
-    data.update({"streams": streams})
-    return json.dumps(data)
+def m3u_to_jsonl(src, fp=None):
+    """
+    Playlist -> JSON lines (one iter_m3u() record per line), written as entries are parsed
 
+    Args:
+        Required - src (str, Path, file, Response) - anything iter_m3u() reads
+        Optional - fp (file-like) - write here and return #records; without it a line generator is returned
+    Usage:
+        with open("xteve.jsonl", "w") as f:
+            m3u_to_jsonl("https://xteve.example.com/m3u/xteve.m3u", f)
+    """
+    lines = (json.dumps(stream) + "\n" for stream in iter_m3u(src))
+    if fp is None:
+        return lines
+    count = 0
+    for line in lines:
+        fp.write(line)
+        count += 1
+    return count
+
+
+RE_EXTINF_ATTR = re.compile(r'([\w\-]+)="([^"]*)"')
+
+
+def iter_lines(src):
+    """Yield text lines from m3u content, a URL, a file path, a file handle or a requests.Response"""
+    if hasattr(src, "iter_lines"):
+        yield from src.iter_lines(decode_unicode=True)
+        return
+    if hasattr(src, "read"):
+        for line in src:
+            yield line.decode(errors="ignore") if isinstance(line, bytes) else line
+        return
+    if isinstance(src, bytes):
+        src = src.decode(errors="ignore")
+    if isinstance(src, str) and src.lower().startswith("http") and "\n" not in src:
+        r = requests.get(src, stream=True)
+        r.raise_for_status()
+        r.encoding = r.encoding or "utf-8"
+        yield from r.iter_lines(decode_unicode=True)
+        return
+    if isinstance(src, Path) or ("\n" not in src and not src.startswith("#") and Path(src).is_file()):
+        with open(src, encoding="utf-8", errors="ignore") as f:
+            yield from f
+        return
+    yield from src.splitlines()
+
+
+def getStreamID(url):
+    """Stream id from a stream url: last path segment without extensions (ex: ".../175784.m3u8" -> "175784")"""
+    return url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1].split(".", 1)[0]
+
+
+def parseExtinf(line):
+    """Split an "#EXTINF:" line into (duration, attributes, title)"""
+    body = line[8:]
+    end = 0
+    attrs = {}
+    for m in RE_EXTINF_ATTR.finditer(body):
+        attrs[m.group(1)] = m.group(2)
+        end = m.end()
+    # -- the title follows the first comma after the last attribute (group-title="A, B" is safe)
+    comma = body.find(",", end)
+    head, title = (body[:comma], body[comma + 1:]) if comma >= 0 else (body, "")
+    try:
+        duration = int(float(head.split(None, 1)[0])) if head.strip() else -1
+    except ValueError:
+        duration = -1
+    return duration, attrs, title.strip()
 
-def m3u_to_dict(src):
-    def parse_iptv_attributes(line, lineno, data, state):
-        # Customize parsing #EXTINF
-        if line.startswith(protocol.extinf):
-            title = ''
-            chunks = line.replace(protocol.extinf + ':', '').split(',', 1)
-            if len(chunks) == 2:
-                duration_and_props, title = chunks
-            elif len(chunks) == 1:
-                duration_and_props = chunks[0]
-
-            additional_props = {}
-            chunks = duration_and_props.strip().split(' ', 1)
-            if len(chunks) == 2:
-                duration, raw_props = chunks
-                matched_props = re.finditer(r'([\w\-]+)="([^"]*)"', raw_props)
-                for match in matched_props:
-                    additional_props[match.group(1)] = match.group(2)
-            else:
-                duration = duration_and_props
 
-            if 'segment' not in state:
-                state['segment'] = {}
-            state['segment']['duration'] = float(duration)
-            state['segment']['title'] = title
+def iter_m3u(src, header=None):
+    """
+    Single-pass IPTV M3U parser yielding one record per stream
 
-            # Helper function for saving custom values
-            save_segment_custom_value(state, 'extinf_props', additional_props)
+    Attributes are tokenized with one compiled regex and the "#EXTINF" / url pairing is done line by line,
+    so extra lines ("#EXTVLCOPT", "#EXTGRP", blank lines) never shift entries.
 
-            # Tell 'main parser' that we expect an URL on next lines
-            state['expect_segment'] = True
+    Args:
+        Required - src (str, Path, file, Response) - m3u content, URL, file path, file handle or requests.Response
+        Optional - header (dict) - filled with the "#EXTM3U" attributes (ex: url-tvg)
+    Returns:
+        Generator of {**extinf_attributes, "url", "title", "stream_id", "duration"}
+    Usage:
+        for stream in iter_m3u("https://xteve.example.com/m3u/xteve.m3u"):
+            print(stream["tvg-id"], stream["stream_id"])
+    """
+    info = None
+    for line in iter_lines(src):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXTINF:"):
+            duration, attrs, title = parseExtinf(line)
+            info = dict(attrs, title=title, duration=duration)
+        elif line.startswith("#"):
+            if line.startswith("#EXTM3U") and header is not None:
+                header.update(RE_EXTINF_ATTR.findall(line))
+            elif line.startswith("#EXTGRP:") and info is not None:
+                info.setdefault("group-title", line[8:].strip())
+        elif info is not None:
+            yield dict(info, url=line, stream_id=getStreamID(line))
+            info = None
 
-            # Tell 'main parser' that it can go to next line, we've parsed current fully.
-            return True
-    def getStreamID(url):
-        path = Path(str(furl(url).path))
-        path = Path(str(path).removesuffix(''.join(path.suffixes)))
-        stream_id = path.name
-        return stream_id
 
-    if not src.lower().startswith('http'):
-        parsed = m3u8.loads(src, custom_tags_parser=parse_iptv_attributes)
-    else:
-        parsed = m3u8.load(src, custom_tags_parser=parse_iptv_attributes)
-    m3u = [dict(s.custom_parser_values['extinf_props'], **{"url": s.uri, "title": s.title,
-                   "stream_id": getStreamID(s.uri), "duration": int(s.duration)})
-           for s in parsed.segments]
-    return m3u
+def m3u_to_dict(src):
+    return list(iter_m3u(src))
 
 def dict_to_m3u(src):
     m3u = ['#EXTM3U']
@@ -240,7 +257,324 @@ def dict_to_m3u(src):
         m3u += [f'{s.get("url")}']
     return '\n'.join(m3u)
 
-def epg_to_dict(src):
+
+class M3UWriter(object):
+    """
+    Incremental M3U Playlist Writer
+
+    Emits "#EXTINF" + URL pairs one at a time, so a playlist never has to be held in memory.
+
+    Usage:
+        # -- stream from a bottle handler (bottle iterates the generator)
+        return M3UWriter().iter(entries)
+
+        # -- write to a file (or socket.makefile(), sys.stdout, ...)
+        with open('lemo.m3u', 'w') as f:
+            M3UWriter(f).write(entries)
+
+    Entry Format:
+        {
+            "url": url,
+            "tvg_id": tvg_id,
+            "tvg_name": tvg_name,
+            "tvg_logo": tvg_logo,
+            "tvg_group": tvg_group,
+            "tvg_cuid": tvg_cuid,   # optional
+            "title": title          # optional (defaults to tvg_name)
+        }
+    """
+    header = "#EXTM3U\n"
+
+    def __init__(self, fp=None):
+        """
+        Args:
+            Optional - fp (file-like) - object with a write() method, required by write()
+        """
+        self.fp = fp
+        self.count = 0
+
+    def extinf(self, tvg_id="", tvg_name="", tvg_logo="", tvg_group="", tvg_cuid=None, title=None):
+        """Format a single #EXTINF line"""
+        cuid = "" if tvg_cuid is None else f'CUID="{tvg_cuid}" '
+        title = tvg_name if title is None else title
+        return (
+            f'#EXTINF:-1 {cuid}tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" '
+            f'group-title="{tvg_group}",{title}\n'
+        )
+
+    def entry(self, url="", **info):
+        """Format a single #EXTINF + URL pair"""
+        return self.extinf(**info) + f'{url}\n'
+
+    def iter(self, entries, header=True):
+        """Yield the playlist header and then one "#EXTINF + URL" chunk per entry"""
+        if header:
+            yield self.header
+        for info in entries:
+            self.count += 1
+            yield self.entry(**info)
+
+    def write(self, entries, header=True):
+        """Write the playlist to self.fp as entries arrive; returns #entries written"""
+        for chunk in self.iter(entries, header=header):
+            self.fp.write(chunk)
+        if hasattr(self.fp, "flush"):
+            self.fp.flush()
+        return self.count
+
+
+class XMLTVWriter(object):
+    """
+    Incremental XMLTV Guide Writer
+
+    Emits <channel> and <programme> elements one at a time (text is XML escaped),
+    so full-provider guides never have to be held in memory.
+
+    Usage:
+        # -- stream from a bottle handler (bottle iterates the generator)
+        return XMLTVWriter(url=url).iter(channels, programs)
+
+        # -- write to a file (or socket.makefile('wb'), sys.stdout, ...)
+        with open('epg.xml.gz', 'wb') as f:
+            XMLTVWriter(f, url=url, compress=True).write(channels, programs)
+
+    Channel Format:
+        {
+            "tvg_id": tvg_id,
+            "tvg_name": tvg_name,
+            "tvg_logo": tvg_logo
+        }
+
+    Program Format:
+        {
+            "tvg_id": tvg_id,
+            "epg_title": epg_title,
+            "epg_start": epg_start,
+            "epg_stop": epg_stop,
+            "epg_desc": epg_desc,
+            "epg_icon": epg_icon    # optional
+        }
+    """
+    footer = "</tv>\n"
+    RE_INVALID = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+    def __init__(self, fp=None, url="", compress=False):
+        """
+        Args:
+            Optional - fp (file-like) - object with a write() method, required by write()
+            Optional - url (str) - generator-info-url
+            Optional - compress (bool) - gzip the output (iter() then yields bytes)
+        """
+        self.fp = fp
+        self.url = url
+        self.compress = compress
+        self.channels = 0
+        self.programs = 0
+
+    def text(self, value):
+        """Escape element text (drops characters XML 1.0 does not allow)"""
+        return escape(self.RE_INVALID.sub("", str(value)))
+
+    def attr(self, value):
+        """Escape a double-quoted attribute value"""
+        return escape(self.RE_INVALID.sub("", str(value)), {'"': "&quot;"})
+
+    def header(self):
+        """Format the XML declaration and opening <tv> tag"""
+        return (
+            '<?xml version="1.0" encoding="utf-8" ?>\n'
+            '<!DOCTYPE tv SYSTEM "xmltv.dtd">\n'
+            f'<tv generator-info-name="IPTV" generator-info-url="{self.attr(self.url)}">\n'
+        )
+
+    def channel(self, tvg_id="", tvg_name="", tvg_logo="", **info):
+        """Format a single <channel> element"""
+        return (
+            f'    <channel id="{self.attr(tvg_id)}">\n'
+            f'        <display-name>{self.text(tvg_name)}</display-name>\n'
+            f'        <icon src="{self.attr(tvg_logo)}"/>\n'
+            '    </channel>\n'
+        )
+
+    def programme(self, tvg_id="", epg_title="", epg_start="", epg_stop="", epg_desc="", epg_icon=None, **info):
+        """Format a single <programme> element"""
+        icon = f'        <icon src="{self.attr(epg_icon)}"/>\n' if epg_icon else ""
+        return (
+            f'    <programme channel="{self.attr(tvg_id)}" '
+            f'start="{self.attr(epg_start)}" stop="{self.attr(epg_stop)}">\n'
+            f'        <title lang="en">{self.text(epg_title)}</title>\n'
+            f'        <desc lang="en">{self.text(epg_desc)}</desc>\n'
+            f'{icon}'
+            '    </programme>\n'
+        )
+
+    def chunks(self, channels=[], programs=[]):
+        """Yield the guide as text: header, every channel, every programme, footer"""
+        yield self.header()
+        for info in channels:
+            self.channels += 1
+            yield self.channel(**info) if isinstance(info, dict) else self.channel(*info)
+        for info in programs:
+            self.programs += 1
+            # -- tuples follow the argument order (ex: XtreamAPI.normalizeListings rows)
+            yield self.programme(**info) if isinstance(info, dict) else self.programme(*info)
+        yield self.footer
+
+    def iter(self, channels=[], programs=[]):
+        """Yield the guide one element at a time (gzip compressed bytes when self.compress)"""
+        if not self.compress:
+            yield from self.chunks(channels, programs)
+            return
+        # -- wbits=31: zlib stream with a gzip header/trailer
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in self.chunks(channels, programs):
+            data = gz.compress(chunk.encode())
+            if data:
+                yield data
+        yield gz.flush()
+
+    def write(self, channels=[], programs=[]):
+        """Write the guide to self.fp as elements arrive; returns #elements written"""
+        binary = not isinstance(self.fp, io.TextIOBase)
+        if self.compress and not binary:
+            raise TypeError("compress=True needs a binary file object, e.g. open(path, 'wb')")
+        for chunk in self.iter(channels, programs):
+            self.fp.write(chunk.encode() if binary and isinstance(chunk, str) else chunk)
+        if hasattr(self.fp, "flush"):
+            self.fp.flush()
+        return self.channels + self.programs
+
+
+class ProgrammeStore(object):
+    """
+    Compact Columnar Programme Container
+
+    Programmes live in parallel arrays (epoch-int start/stop, channel index) with channel ids,
+    titles and descriptions interned, instead of one 5-6 key dict per programme. Each channel keeps
+    its rows sorted by start, so time windows are found by bisection instead of a scan.
+
+    Usage:
+        store = ProgrammeStore()
+        store.extend(xtream.normalizeListings(listings))   # tuples, dicts or XMLTVWriter programs
+        tonight = store.window(start=time.time(), stop=time.time() + 6 * 60 * 60)
+        XMLTVWriter(f).write(channels, tonight)             # iterates (tvg_id, title, start, stop, desc, icon) rows
+        for row in store.rows(tvg_ids=["abckmiz.us"]):
+            print(row)
+    """
+    FIELDS = ("tvg_id", "epg_title", "epg_start", "epg_stop", "epg_desc", "epg_icon")
+
+    def __init__(self, programs=[]):
+        """
+        Args:
+            Optional - programs (iterable) - initial programmes (see extend())
+        """
+        self.tvg_ids = []           # -- channel index -> tvg_id
+        self.channel_index = {}     # -- tvg_id -> channel index
+        self.strings = {}           # -- interned titles / descriptions
+        self.channel = array("l")
+        self.start = array("q")
+        self.stop = array("q")
+        self.title = []
+        self.desc = []
+        self.icons = {}             # -- row -> icon (most programmes have none)
+        self.by_channel = {}        # -- channel index -> array of rows, sorted by start
+        self.channel_starts = {}    # -- channel index -> array of those rows' starts (bisect key)
+        self.longest = 0            # -- longest programme, bounds how far back a window can overlap
+        self.extend(programs)
+
+    def __len__(self):
+        return len(self.start)
+
+    def __iter__(self):
+        return self.rows(epg_fmt=True)
+
+    def intern(self, value):
+        return self.strings.setdefault(value, value)
+
+    @staticmethod
+    def epoch(value):
+        """Epoch int for ints, floats, digit strings or anything toEpoch() reads (0 when unknown)"""
+        if isinstance(value, (int, float)):
+            return int(value)
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+        return toEpoch(value) or 0
+
+    def add(self, tvg_id="", epg_title="", epg_start=0, epg_stop=0, epg_desc="", epg_icon=None, **info):
+        """Add one programme (start/stop as epochs or anything toEpoch() reads)"""
+        tvg_id = str(tvg_id)
+        index = self.channel_index.get(tvg_id)
+        if index is None:
+            index = self.channel_index[tvg_id] = len(self.tvg_ids)
+            self.tvg_ids.append(tvg_id)
+            self.by_channel[index] = array("l")
+            self.channel_starts[index] = array("q")
+        p_start, p_stop = self.epoch(epg_start), self.epoch(epg_stop)
+        row = len(self.start)
+        self.channel.append(index)
+        self.start.append(p_start)
+        self.stop.append(p_stop)
+        self.title.append(self.intern(epg_title or ""))
+        self.desc.append(self.intern(epg_desc or ""))
+        if epg_icon:
+            self.icons[row] = epg_icon
+        self.longest = max(self.longest, p_stop - p_start)
+
+        # -- guides arrive mostly in order per channel, so this is nearly always an append
+        rows, starts = self.by_channel[index], self.channel_starts[index]
+        i = len(starts) if not starts or starts[-1] <= p_start else bisect.bisect_right(starts, p_start)
+        rows.insert(i, row)
+        starts.insert(i, p_start)
+
+    def extend(self, programs=[]):
+        """Append programmes given as dicts or tuples in FIELDS order"""
+        for info in programs:
+            self.add(**info) if isinstance(info, dict) else self.add(*info)
+
+    def channels(self):
+        """Channel ids in first-seen order"""
+        return list(self.tvg_ids)
+
+    def selectRows(self, start=None, stop=None, tvg_ids=None):
+        """Row numbers overlapping start/stop (epochs or EPG strings) for the given channels, in start order"""
+        start = None if start is None else self.epoch(start)
+        stop = None if stop is None else self.epoch(stop)
+        if tvg_ids is None:
+            indexes = range(len(self.tvg_ids))
+        else:
+            indexes = [i for i in (self.channel_index.get(str(tvg_id)) for tvg_id in tvg_ids) if i is not None]
+        p_start, p_stop = self.start, self.stop
+        selected = []
+        for index in indexes:
+            rows, starts = self.by_channel[index], self.channel_starts[index]
+            # -- rows starting more than "longest" before the window cannot reach into it
+            lo = 0 if start is None else bisect.bisect_right(starts, start - self.longest)
+            hi = len(starts) if stop is None else bisect.bisect_left(starts, stop)
+            selected.append([rows[i] for i in range(lo, hi) if start is None or p_stop[rows[i]] > start])
+        if len(selected) == 1:
+            return selected[0]
+        return list(heapq.merge(*selected, key=p_start.__getitem__))
+
+    def rows(self, start=None, stop=None, tvg_ids=None, epg_fmt=False):
+        """
+        Yield (tvg_id, epg_title, epg_start, epg_stop, epg_desc, epg_icon) tuples
+
+        Args:
+            Optional - start / stop - time window (programmes overlapping it are kept)
+            Optional - tvg_ids (list) - only these channels (per-channel index, no full scan)
+            Optional - epg_fmt (bool) - start/stop as XMLTV strings instead of epoch ints
+        """
+        fmt = (lambda t: formatEPGTime(t, epg_fmt=True)) if epg_fmt else (lambda t: t)
+        for r in self.selectRows(start=start, stop=stop, tvg_ids=tvg_ids):
+            yield (self.tvg_ids[self.channel[r]], self.title[r], fmt(self.start[r]), fmt(self.stop[r]),
+                   self.desc[r], self.icons.get(r))
+
+    def window(self, start=None, stop=None, tvg_ids=None):
+        """New ProgrammeStore holding only the programmes overlapping start/stop"""
+        return ProgrammeStore(self.rows(start=start, stop=stop, tvg_ids=tvg_ids))
+
+
+def epg_to_dict(src, channels=None, start=None, stop=None):
     # -- https://github.com/martinblech/xmltodict | https://github.com/dart-neitro/xmltodict3
     """
     <?xml version="1.0" encoding="utf-8"?>
@@ -269,14 +603,257 @@ def epg_to_dict(src):
             ]
         }
     }
+
+    Optional - channels / start / stop filter while parsing (see iterEPGElements)
     """
+    tv = {}
+    records = {"channel": [], "programme": []}
+    for tag, elem in iterEPGElements(src, channels=channels, start=start, stop=stop, root=tv):
+        records[tag].append(elementToDict(elem))
+    # -- same shape as xmltodict: a lone element is not wrapped in a list
+    return {"tv": dict(tv, **{k: v if len(v) > 1 else v[0] for k, v in records.items() if v})}
+
+
+class ChunkStream(io.RawIOBase):
+    """Read-only binary file object over an iterable of str/bytes chunks (e.g. XMLTVWriter.iter())"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.buffer = chunk.encode() if isinstance(chunk, str) else chunk
+        n = min(len(b), len(self.buffer))
+        b[:n], self.buffer = self.buffer[:n], self.buffer[n:]
+        return n
+
+
+def openEPG(src):
+    """Open an XMLTV source (path, URL, raw XML, file object or chunk generator) as a binary stream, gzip or not"""
+    if hasattr(src, "read"):
+        return src
+    if isinstance(src, bytes) or (isinstance(src, str) and src.lstrip().startswith("<")):
+        return io.BytesIO(src.encode() if isinstance(src, str) else src)
+    if not isinstance(src, (str, Path)):
+        fp = io.BufferedReader(ChunkStream(src))
+        return gzip.GzipFile(fileobj=fp) if fp.peek(2)[:2] == b"\x1f\x8b" else fp
+    if str(src).startswith(("http://", "https://")):
+        r = requests.get(str(src), stream=True)
+        r.raise_for_status()
+        r.raw.decode_content = True
+        return gzip.GzipFile(fileobj=r.raw) if str(furl(str(src)).path).endswith(".gz") else r.raw
+    fp = open(src, "rb")
+    if fp.read(2) == b"\x1f\x8b":
+        fp.seek(0)
+        return gzip.GzipFile(fileobj=fp)
+    fp.seek(0)
+    return fp
+
+
+def iterEPGElements(src, channels=None, start=None, stop=None, root=None):
+    """Yield ("channel" | "programme", element) pairs from an XMLTV source with lxml.iterparse
+
+    Elements are only valid until the next pair is requested (they are cleared to keep memory flat).
+
+    Args:
+        Required - src (str, Path, file) - XMLTV path, URL, raw XML or binary file object
+        Optional - channels (iterable) - keep only these channel ids
+        Optional - start (str, datetime, int) - drop programmes that end before this time
+        Optional - stop (str, datetime, int) - drop programmes that begin after this time
+        Optional - root (dict) - filled with the <tv> attributes (xmltodict "@" style)
+    """
+    channels = None if channels is None else set(map(str, channels))
+    start = start if start is None or isinstance(start, int) else toEpoch(start)
+    stop = stop if stop is None or isinstance(stop, int) else toEpoch(stop)
+    fp = openEPG(src)
+    try:
+        for event, elem in etree.iterparse(fp, events=("start", "end"), tag=("tv", "channel", "programme"),
+                                           resolve_entities=False, huge_tree=True):
+            if elem.tag == "tv":
+                if event == "start" and root is not None:
+                    root.update({f"@{k}": v for k, v in elem.attrib.items()})
+                continue
+            if event != "end":
+                continue
+            tvg_id = elem.get("id" if elem.tag == "channel" else "channel")
+            keep = channels is None or tvg_id in channels
+            if keep and elem.tag == "programme" and (start is not None or stop is not None):
+                p_start, p_stop = toEpoch(elem.get("start", "")), toEpoch(elem.get("stop", ""))
+                keep = not ((start is not None and p_stop is not None and p_stop <= start) or
+                            (stop is not None and p_start is not None and p_start >= stop))
+            if keep:
+                yield elem.tag, elem
+            # -- free the parsed element and everything before it
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    finally:
+        if fp is not src:
+            fp.close()
+
+
+def iterEPG(src, channels=None, start=None, stop=None):
+    """Stream channel and programme records out of an XMLTV source (constant memory)
+
+    Records use the XMLTVWriter formats, so a guide can be filtered and re-written in one pass:
+        XMLTVWriter(f).write(*splitEPG(iterEPG("epg.xml", channels=["abckmiz.us"])))
+
+    Args:
+        Required - src (str, Path, file) - XMLTV path, URL, raw XML or binary file object
+        Optional - channels (iterable) - keep only these channel ids
+        Optional - start (str, datetime, int) - drop programmes that end before this time
+        Optional - stop (str, datetime, int) - drop programmes that begin after this time
+    Returns:
+        Generator of ("channel", channel) and ("programme", program) pairs
+    Usage:
+        for tag, record in iterEPG("epg.xml.gz", start="20220218080000 +0000", stop="20220219080000 +0000"):
+            print(tag, record["tvg_id"])
+    """
+    for tag, elem in iterEPGElements(src, channels=channels, start=start, stop=stop):
+        # -- one pass over the children (findtext() walks ElementPath per call)
+        children = {}
+        for child in elem:
+            children.setdefault(child.tag, child)
+        icon = children.get("icon")
+        if tag == "channel":
+            name = children.get("display-name")
+            yield tag, {
+                "tvg_id": elem.get("id", ""),
+                "tvg_name": "" if name is None else (name.text or ""),
+                "tvg_logo": "" if icon is None else icon.get("src", ""),
+            }
+        else:
+            title, desc = children.get("title"), children.get("desc")
+            program = {
+                "tvg_id": elem.get("channel", ""),
+                "epg_title": "" if title is None else (title.text or ""),
+                "epg_start": elem.get("start", ""),
+                "epg_stop": elem.get("stop", ""),
+                "epg_desc": "" if desc is None else (desc.text or ""),
+            }
+            if icon is not None:
+                program["epg_icon"] = icon.get("src", "")
+            yield tag, program
+
+
+def mergeEPG(sources=[], channels=None, start=None, stop=None):
+    """Merge several XMLTV sources into one guide (k-way merge on programme start time)
+
+    Channels are merged by id (the first source listing a channel wins). Each source is split into one
+    lazily filled stream per channel it lists, and heapq.merge() walks all (source, channel) streams in
+    start order, so programmes are yielded as they are read. A programme is dropped when it starts
+    before the last one kept for its channel ends; on equal start times the earlier source wins.
+
+    Notes:
+        - each channel's programmes must be in start order within a source (any channel interleaving
+          is fine); memory stays bounded by the number of channels when a source lists its programmes
+          in time order, while a channel-grouped source is read ahead (and buffered) as far as needed
+          to reach the next programme of every channel, including channels without any programmes
+        - programmes of channels a source does not list are skipped
+        - programmes crossing start/stop are clipped to the window (the clipped edge is written in
+          UTC "+0000"); every other time is passed through unchanged
+
+    Args:
+        Required - sources (list) - XMLTV paths, URLs, raw XML or xml*(stream=True) generators,
+                                    in priority order
+        Optional - channels (iterable) - keep only these channel ids
+        Optional - start (str, datetime, int) - drop programmes that end before this time, clip the rest
+        Optional - stop (str, datetime, int) - drop programmes that begin after this time, clip the rest
+    Returns:
+        (channels, programs) - channel list and a programme generator for XMLTVWriter
+    Usage:
+        kemo, chapo = KemoAPI(), ChapoAPI()
+        sources = ["lemo_epg.xml.gz", kemo.xmlNFL(stream=True), chapo.xmlNFL(stream=True)]
+        with open("epg.xml.gz", "wb") as f:
+            XMLTVWriter(f, compress=True).write(*mergeEPG(sources, start=getEPGTimeNow(epg_fmt=True)))
+    """
+    window_start = start if start is None or isinstance(start, int) else toEpoch(start)
+    window_stop = stop if stop is None or isinstance(stop, int) else toEpoch(stop)
+    merged_channels = {}
+    streams = []
+    for records in (iterEPG(src, channels=channels, start=start, stop=stop) for src in sources):
+        # -- channels come first in XMLTV, so read up to the first programme of each source
+        listed, programs = [], iter(())
+        for tag, record in records:
+            if tag == "channel":
+                merged_channels.setdefault(record["tvg_id"], record)
+                listed.append(record["tvg_id"])
+            else:
+                programs = chain([record], (program for tag, program in records if tag == "programme"))
+                break
+        streams += channelStreams(programs, listed)
+
+    def clip(program):
+        p_start, p_stop = toEpoch(program["epg_start"]), toEpoch(program["epg_stop"])
+        if window_start is not None and p_start is not None and p_start < window_start:
+            program = dict(program, epg_start=time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(window_start)))
+        if window_stop is not None and p_stop is not None and p_stop > window_stop:
+            program = dict(program, epg_stop=time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(window_stop)))
+        return program
+
+    def programs():
+        last_stop = {}
+        for program in heapq.merge(*streams, key=lambda program: toEpoch(program["epg_start"]) or 0):
+            p_start, p_stop = toEpoch(program["epg_start"]), toEpoch(program["epg_stop"])
+            if p_start is not None and p_start < last_stop.get(program["tvg_id"], p_start):
+                continue
+            if p_stop is not None:
+                last_stop[program["tvg_id"]] = p_stop
+            yield clip(program)
+
+    return list(merged_channels.values()), programs()
+
+
+def channelStreams(programs, tvg_ids):
+    """Split one programme iterator into lazily filled per-channel iterators (other channels' programmes queue up)"""
+    queues = {tvg_id: deque() for tvg_id in tvg_ids}
+
+    def stream(queue):
+        while True:
+            while not queue:
+                program = next(programs, None)
+                if program is None:
+                    return
+                if program["tvg_id"] in queues:
+                    queues[program["tvg_id"]].append(program)
+            yield queue.popleft()
+
+    return [stream(queue) for queue in queues.values()]
+
+
+def splitEPG(records):
+    """Split iterEPG() output into (channels, programs) lists for XMLTVWriter"""
+    channels, programs = [], []
+    for tag, record in records:
+        (channels if tag == "channel" else programs).append(record)
+    return channels, programs
+
+
+def elementToDict(elem):
+    """Convert an lxml element into the xmltodict layout ("@attr", "#text", repeated tags -> list)"""
+    data = {f"@{k}": v for k, v in elem.attrib.items()}
+    for child in elem:
+        value = elementToDict(child)
+        if child.tag in data:
+            if not isinstance(data[child.tag], list):
+                data[child.tag] = [data[child.tag]]
+            data[child.tag].append(value)
+        else:
+            data[child.tag] = value
+    text = (elem.text or "").strip()
+    if not data:
+        return text or None
+    if text:
+        data["#text"] = text
+    return data
 
-    if len(src) > 100:
-        xml = src
-    else:
-        xml = Path(src).read_text() if Path(src).is_file() else src
-    # return xmltodict.parse(xml, attr_prefix="", dict_constructor=dict)
-    return xmltodict.parse(xml, dict_constructor=dict)
 
 def dict_to_epg(src):
     """
@@ -309,30 +886,50 @@ def dict_to_epg(src):
     """
     return xmltodict.unparse(src, pretty=True)
 
-def replaceLogos(xteve_url='', iptv_src=''):
-    def translate(text, conversion_dict):
-        """
-        Translate words from a text using a conversion dictionary
 
-        Arguments:
-            text: the text to be translated
-            conversion_dict: the conversion dictionary
-        """
-        for key, value in conversion_dict.items():
-            text = text.replace(key, value)
-        return text
+RE_TVG_LOGO = re.compile(r'(tvg-logo=")([^"]*)(")')
 
-    # xteve_url = "https://xteve2.mangoboat.tv/xmltv/xteve.m3u"
-    xteve_m3u = {channel.pop("title"):channel for channel in m3u_to_dict(xteve_url)}
 
-    # iptv_url = "https://proxy.hopto.org/lemo2_m3u?token=18aa90864b1a4d964f5866f4bf18e55f"
-    # iptv_src = requests.get(iptv_url).text
-    iptv_m3u = {channel.pop("title"):channel for channel in m3u_to_dict(iptv_src)}
+def logoIndex(src):
+    """
+    {title: tvg-logo} lookup for replaceLogos()
 
-    changes = {iptv_m3u[title]["tvg-logo"]:xteve_m3u[title]["tvg-logo"] for title in (xteve_m3u.keys()&iptv_m3u.keys())}
-    return translate(iptv_src, changes)
+    Args:
+        Required - src (str, list, dict) - anything iter_m3u() reads, parsed records, or an existing index
+    Usage:
+        xteve_logos = logoIndex("https://xteve.example.com/m3u/xteve.m3u")   # build once, reuse per playlist
+    """
+    if isinstance(src, dict):
+        return src
+    records = src if isinstance(src, list) else iter_m3u(src)
+    return {channel["title"]: channel.get("tvg-logo", "") for channel in records}
 
 
+def replaceLogos(xteve_url='', iptv_src=''):
+    """
+    Swap the logos of an IPTV playlist for the ones xTeVe uses (matched by channel title)
+
+    Each "#EXTINF" line is rewritten on its own, keyed by its title (the text after the comma), so
+    channels sharing a logo (or having none) only pick up the xTeVe logo of their own title.
+    Lines whose title is not in the xTeVe playlist, or whose xTeVe logo is empty, are left untouched.
+
+    Args:
+        Required - xteve_url (str, list, dict) - xTeVe playlist (url/text), its parsed records, or a logoIndex()
+        Required - iptv_src (str) - IPTV playlist text to rewrite
+    Returns:
+        The rewritten playlist text
+    """
+    xteve_logos = logoIndex(xteve_url)
+
+    lines = iptv_src.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if not line.startswith("#EXTINF"):
+            continue
+        logo = xteve_logos.get(parseExtinf(line)[2])
+        if logo:
+            lines[i] = RE_TVG_LOGO.sub(lambda m: m.group(1) + logo + m.group(3), line, count=1)
+    return "".join(lines)
+
 
 def getNFLTeams():
     # -- get NFL season start year
@@ -483,6 +1080,11 @@ def convertEPGTime(p_time="", dt_obj=False, epg_fmt=False):
         Timestamp('2021-08-03 14:00:00-0400', tz='US/Eastern')
 
     """
+    if not dt_obj:
+        # -- fast path: no pandas for the common str/datetime inputs
+        epoch = toEpoch(p_time)
+        if epoch is not None:
+            return formatEPGTime(epoch, epg_fmt=epg_fmt)
     est_dt = pd.to_datetime(p_time).tz_convert('US/Eastern')
     if dt_obj:
         return est_dt
@@ -491,6 +1093,77 @@ def convertEPGTime(p_time="", dt_obj=False, epg_fmt=False):
     return est_dt.strftime("%Y-%m-%d %I:%M:%S %p")
 
 
+def convertEPGTimes(p_times=[], dt_obj=False, epg_fmt=False):
+    """Batch version of convertEPGTime() (one vectorized conversion for a whole column)
+
+    Args:
+        p_times (list, Series): datetime strings (or objects) to convert; naive values are treated as UTC
+        dt_obj (:obj:`bool`, optional): Request datetime objects. Default=False
+        epg_fmt (bool, optional): Request epg formatted strings. Default=False
+
+    Returns:
+        Series when given a Series, otherwise a list
+
+    Examples:
+        >>> convertEPGTimes(["20210803180000 +0000", "20210803190000 +0000"], epg_fmt=True)
+        ['20210803140000 -0400', '20210803150000 -0400']
+    """
+    series = p_times if isinstance(p_times, pd.Series) else pd.Series(list(p_times), dtype=object)
+    try:
+        est_dt = pd.to_datetime(series, format="%Y%m%d%H%M%S %z", utc=True)
+    except (ValueError, TypeError):
+        est_dt = pd.to_datetime(series, utc=True)
+    est_dt = est_dt.dt.tz_convert('US/Eastern')
+    if dt_obj:
+        result = est_dt
+    elif epg_fmt:
+        result = est_dt.dt.strftime("%Y%m%d%H%M%S %z")
+    else:
+        result = est_dt.dt.strftime("%Y-%m-%d %I:%M:%S %p")
+    return result if isinstance(p_times, pd.Series) else result.tolist()
+
+
+EPG_TZ = ZoneInfo('US/Eastern')
+XMLTV_TIME = re.compile(r'^(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})\s*([+-])(\d{2})(\d{2})$')
+
+
+def toEpoch(p_time):
+    """Seconds since epoch for XMLTV/ISO strings and tz-aware datetimes (None when not handled)"""
+    if isinstance(p_time, (int, float)):
+        return None
+    if isinstance(p_time, dt):
+        return int(p_time.timestamp()) if p_time.tzinfo else None
+    if isinstance(p_time, str):
+        m = XMLTV_TIME.match(p_time.strip())
+        if m:
+            year, month, day, hour, minute, second = map(int, m.groups()[:6])
+            offset = (int(m[8]) * 3600 + int(m[9]) * 60) * (-1 if m[7] == '-' else 1)
+            return calendar.timegm((year, month, day, hour, minute, second)) - offset
+        try:
+            d = dt.fromisoformat(p_time.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return int(d.timestamp()) if d.tzinfo else None
+    return None
+
+
+@lru_cache(maxsize=8192)
+def getEPGOffset(epoch_hour):
+    """US/Eastern UTC offset in seconds for an epoch hour (DST switches happen on the hour)"""
+    return int(dt.fromtimestamp(epoch_hour * 3600, EPG_TZ).utcoffset().total_seconds())
+
+
+def formatEPGTime(epoch, epg_fmt=False):
+    """Format epoch seconds as US/Eastern EPG time without pandas"""
+    offset = getEPGOffset(int(epoch) // 3600)
+    local = time.gmtime(int(epoch) + offset)
+    if epg_fmt:
+        sign = '-' if offset < 0 else '+'
+        hours, minutes = divmod(abs(offset) // 60, 60)
+        return time.strftime("%Y%m%d%H%M%S", local) + f' {sign}{hours:02d}{minutes:02d}'
+    return time.strftime("%Y-%m-%d %I:%M:%S %p", local)
+
+
 def getEPGTimeNow(dt_obj=False, epg_fmt=False):
     """Return EPG Programme "start" and/or "stop" time based on current time (30 minute start)
 
@@ -511,6 +1184,9 @@ def getEPGTimeNow(dt_obj=False, epg_fmt=False):
     >>> getEPGTimeNow(dt_obj=True)
     Timestamp('2021-08-03 16:00:00-0400', tz='US/Eastern')
     """
+    if not dt_obj:
+        # -- US/Eastern offsets are whole hours, so flooring the epoch floors local time too
+        return formatEPGTime(int(time.time()) // 1800 * 1800, epg_fmt=epg_fmt)
     est_dt = pd.to_datetime(time.time(), unit='s', utc=True).tz_convert('US/Eastern').floor('30min')
     if dt_obj:
         return est_dt
@@ -622,6 +1298,282 @@ def downloadFile(url='', params={}, file_name='', file_path=''):
     return full_path
 
 
+class ResponseCache(object):
+    """
+    Persistent (SQLite) Response Cache for Xtream "player_api.php" Actions
+
+    Responses are keyed by (api_url, username, action, category_id, stream_id) and served from disk
+    while younger than the action's TTL. Stale entries are revalidated with If-None-Match /
+    If-Modified-Since when the provider sent an ETag / Last-Modified, so a "304" costs no download.
+    Login failures (a 200 with {"user_info": {"auth": 0}}) are returned but never stored.
+
+    Usage:
+        cache = ResponseCache(ttls={"get_live_streams": 60})
+        categories = cache.get(api_url, params={"username": u, "password": p, "action": "get_live_categories"})
+    """
+    TTLS = {
+        "get_live_categories": 6 * 60 * 60,
+        "get_live_streams": 5 * 60,
+        "get_short_epg": 30 * 60,
+        "get_simple_data_table": 30 * 60,
+    }
+
+    def __init__(self, db_path="", ttls={}, default_ttl=5 * 60, validate=None):
+        """
+        Args:
+            Optional - db_path (str) - sqlite file (default: ~/.cache/plexarr/responses.db)
+            Optional - ttls (dict) - per-action TTL overrides in seconds (0 disables caching for an action)
+            Optional - default_ttl (int) - TTL for actions not listed in TTLS
+            Optional - validate (callable) - validate(data) -> bool, only True bodies are stored (default: authorized)
+        """
+        db_path = Path(db_path) if db_path else Path.home().joinpath(".cache", "plexarr", "responses.db")
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(db_path)
+        self.ttls = dict(self.TTLS, **ttls)
+        self.default_ttl = default_ttl
+        self.validate = validate or self.authorized
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                api_url TEXT, username TEXT, action TEXT, category_id TEXT, stream_id TEXT,
+                body TEXT, etag TEXT, last_modified TEXT, fetched REAL,
+                PRIMARY KEY (api_url, username, action, category_id, stream_id)
+            )
+        """)
+        self.db.commit()
+
+    @staticmethod
+    def authorized(data):
+        """False for Xtream login failures, which still come back as "200" ({"user_info": {"auth": 0}})"""
+        if isinstance(data, dict) and "user_info" in data:
+            return bool((data["user_info"] or {}).get("auth"))
+        return True
+
+    def key(self, api_url, params):
+        """Cache key for a player_api.php request (ignores ids the action does not take)"""
+        action = str(params.get("action", ""))
+        category_id = params.get("category_id") if action.endswith("_streams") else ""
+        stream_id = params.get("stream_id") if action.endswith(("_epg", "_data_table")) else ""
+        return (
+            api_url,
+            str(params.get("username", "")),
+            action,
+            str(category_id or ""),
+            str(stream_id or ""),
+        )
+
+    def get(self, api_url, params={}, ttl=None, validate=None):
+        """
+        Cached requests.get(api_url, params).json()
+
+        Only 2xx responses whose body is a JSON list or object that passes validate are stored;
+        4xx/5xx raise requests.HTTPError.
+
+        Args:
+            Required - api_url (str) - player_api.php url
+            Optional - params (dict) - query parameters (username, password, action, ...)
+            Optional - ttl (int) - override the action's TTL for this call
+            Optional - validate (callable) - override the cache's validate for this call
+        """
+        key = self.key(api_url, params)
+        ttl = ttl if ttl is not None else self.ttls.get(key[2], self.default_ttl)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT body, etag, last_modified, fetched FROM responses "
+                "WHERE api_url=? AND username=? AND action=? AND category_id=? AND stream_id=?", key
+            ).fetchone()
+        if row and ttl and (time.time() - row[3]) < ttl:
+            return json.loads(row[0])
+
+        headers = {}
+        if row and row[1]:
+            headers["If-None-Match"] = row[1]
+        if row and row[2]:
+            headers["If-Modified-Since"] = row[2]
+        r = self.session.get(api_url, params=params, headers=headers)
+        if r.status_code == 304 and row:
+            with self.lock:
+                self.db.execute(
+                    "UPDATE responses SET fetched=? "
+                    "WHERE api_url=? AND username=? AND action=? AND category_id=? AND stream_id=?",
+                    (time.time(), *key)
+                )
+                self.db.commit()
+            return json.loads(row[0])
+
+        r.raise_for_status()
+        data = r.json()
+        if ttl and isinstance(data, (list, dict)) and (validate or self.validate)(data):
+            with self.lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*key, r.text, r.headers.get("ETag"), r.headers.get("Last-Modified"), time.time())
+                )
+                self.db.commit()
+        return data
+
+    def clear(self, api_url="", action=""):
+        """Drop cached responses (all, per api_url, and/or per action)"""
+        query, args = "DELETE FROM responses WHERE 1=1", []
+        if api_url:
+            query, args = query + " AND api_url=?", args + [api_url]
+        if action:
+            query, args = query + " AND action=?", args + [action]
+        with self.lock:
+            self.db.execute(query, args)
+            self.db.commit()
+
+
+class EPGStore(object):
+    """
+    Persistent (SQLite) Per-Channel EPG Store for Incremental Refreshes
+
+    Keeps every fetched listing plus, per stream, the latest "stop" already covered and a hash of the
+    stream's metadata. stale() then picks only the streams whose guide runs out before the horizon or
+    whose metadata changed since the last getM3U(), so an hourly refresh skips most channels.
+
+    Usage:
+        store = EPGStore()
+        todo = store.stale(api_url, streams, horizon=24 * 60 * 60)
+        for stream_id, listings in xtream.fetchEPG(todo, iptv="lemo").items():
+            store.update(api_url, stream_id, listings)
+        listings = store.listings(api_url, start=time.time())
+    """
+    META = ("name", "epg_channel_id", "stream_icon", "category_id")
+
+    def __init__(self, db_path=""):
+        """
+        Args:
+            Optional - db_path (str) - sqlite file (default: ~/.cache/plexarr/epg.db)
+        """
+        db_path = Path(db_path) if db_path else Path.home().joinpath(".cache", "plexarr", "epg.db")
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = str(db_path)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS channels (
+                api_url TEXT, stream_id TEXT, meta TEXT, coverage INTEGER, fetched REAL,
+                PRIMARY KEY (api_url, stream_id)
+            );
+            CREATE TABLE IF NOT EXISTS listings (
+                api_url TEXT, stream_id TEXT, start INTEGER, stop INTEGER, listing TEXT,
+                PRIMARY KEY (api_url, stream_id, start)
+            );
+        """)
+        self.db.commit()
+
+    def meta(self, stream):
+        """Hash of the stream fields that change what its guide should look like"""
+        if not isinstance(stream, dict):
+            return ""
+        info = json.dumps([stream.get(k) for k in self.META], default=str)
+        return hashlib.sha1(info.encode()).hexdigest()
+
+    def times(self, listing):
+        """(start, stop) epoch seconds of an Xtream listing"""
+        start, stop = listing.get("start_timestamp"), listing.get("stop_timestamp")
+        if start and stop:
+            return int(start), int(stop)
+        start = pd.to_datetime(listing["start"], utc=True)
+        stop = pd.to_datetime(listing.get("end") or listing["stop"], utc=True)
+        return int(start.timestamp()), int(stop.timestamp())
+
+    def stale(self, api_url, streams=[], horizon=24 * 60 * 60, retry=6 * 60 * 60, now=None):
+        """
+        Streams that need fetching: unknown, metadata changed, or guide ending before now + horizon
+
+        Args:
+            Required - api_url (str) - player_api.php url
+            Required - streams (list) - stream dicts from get_live_streams (or stream ids)
+            Optional - horizon (int) - seconds of guide each stream should already cover
+            Optional - retry (int) - seconds before re-asking for a stream that returned no listings
+            Optional - now (int) - epoch seconds (default: time.time())
+        """
+        now = int(time.time() if now is None else now)
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT stream_id, meta, coverage, fetched FROM channels WHERE api_url=?", (api_url,)
+            ).fetchall()
+        known = {stream_id: (meta, coverage, fetched) for stream_id, meta, coverage, fetched in rows}
+
+        todo = []
+        for stream in streams:
+            stream_id = str(stream.get("stream_id") if isinstance(stream, dict) else stream)
+            if stream_id not in known:
+                todo.append(stream)
+                continue
+            meta, coverage, fetched = known[stream_id]
+            if isinstance(stream, dict) and meta != self.meta(stream):
+                todo.append(stream)
+            elif coverage is None:
+                if now - fetched >= retry:
+                    todo.append(stream)
+            elif coverage < now + horizon:
+                todo.append(stream)
+        return todo
+
+    def update(self, api_url, stream, listings=[]):
+        """Store freshly fetched listings for a stream (they replace anything stored from their first start on)"""
+        stream_id = str(stream.get("stream_id") if isinstance(stream, dict) else stream)
+        rows = [(api_url, stream_id, *self.times(listing), json.dumps(listing)) for listing in listings]
+        with self.lock:
+            if rows:
+                self.db.execute(
+                    "DELETE FROM listings WHERE api_url=? AND stream_id=? AND start>=?",
+                    (api_url, stream_id, min(row[2] for row in rows))
+                )
+                self.db.executemany("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?)", rows)
+            coverage = self.db.execute(
+                "SELECT MAX(stop) FROM listings WHERE api_url=? AND stream_id=?", (api_url, stream_id)
+            ).fetchone()[0]
+            if isinstance(stream, dict):
+                meta = self.meta(stream)
+            else:
+                row = self.db.execute(
+                    "SELECT meta FROM channels WHERE api_url=? AND stream_id=?", (api_url, stream_id)
+                ).fetchone()
+                meta = row[0] if row else ""
+            self.db.execute(
+                "INSERT OR REPLACE INTO channels VALUES (?, ?, ?, ?, ?)",
+                (api_url, stream_id, meta, coverage, time.time())
+            )
+            self.db.commit()
+
+    def listings(self, api_url, stream_ids=None, start=None, stop=None):
+        """
+        Stored listings as {stream_id: [listing, ...]} (in start order)
+
+        Args:
+            Required - api_url (str) - player_api.php url
+            Optional - stream_ids (list) - only these streams
+            Optional - start (int) - drop listings that end before this epoch
+            Optional - stop (int) - drop listings that begin after this epoch
+        """
+        query, args = "SELECT stream_id, listing FROM listings WHERE api_url=?", [api_url]
+        if start is not None:
+            query, args = query + " AND stop>?", args + [int(start)]
+        if stop is not None:
+            query, args = query + " AND start<?", args + [int(stop)]
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY stream_id, start", args).fetchall()
+        wanted = None if stream_ids is None else set(map(str, stream_ids))
+        epg = {}
+        for stream_id, listing in rows:
+            if wanted is None or stream_id in wanted:
+                epg.setdefault(stream_id, []).append(json.loads(listing))
+        return epg
+
+    def prune(self, before=None):
+        """Drop listings that ended before an epoch (default: now)"""
+        before = int(time.time() if before is None else before)
+        with self.lock:
+            self.db.execute("DELETE FROM listings WHERE stop<?", (before,))
+            self.db.commit()
+
+
 # -- LOGGER CONFIGS -- #
 MODULE = coloredlogs.find_program_name()
 LOG_FILE = 'logs/{}.log'.format(os.path.splitext(MODULE)[0])
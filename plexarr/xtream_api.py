@@ -1,19 +1,99 @@
-import grequests
+import aiohttp
+import asyncio
 from configparser import ConfigParser
 from ast import literal_eval
 from pathlib import Path
-from itertools import chain
 # from teddy import getLogger
-from .utils import getLogger
+from .utils import getLogger, EPGStore, formatEPGTime
+from binascii import a2b_base64, Error as B64Error
+from collections import deque
+from statistics import median
+import pandas as pd
+import json
 import requests
+import random
+import time
 import re
 import os
 
 
 log = getLogger()
 
+
+class AdaptiveLimiter(object):
+    """
+    AIMD concurrency limit for a single provider (asyncio)
+
+    Every "limit" fast successes open one more slot (up to max_limit) and a 429/5xx/timeout halves it.
+    Latency is judged against the median of the last "window" responses, and one slot is given back
+    only after "patience" responses in a row come in slower than slow * that median, so ordinary
+    jitter does not wear the limit down.
+    """
+
+    def __init__(self, limit=4, max_limit=32, slow=3.0, window=50, patience=3):
+        """
+        Args:
+            Optional - limit (int) - starting number of requests in flight
+            Optional - max_limit (int) - ceiling for the limit
+            Optional - slow (float) - latency / median latency ratio treated as "provider is struggling"
+            Optional - window (int) - number of recent latencies the median is taken over
+            Optional - patience (int) - consecutive slow responses before the limit shrinks
+        """
+        self.limit = limit
+        self.max_limit = max_limit
+        self.slow = slow
+        self.patience = patience
+        self.latencies = deque(maxlen=window)
+        self.in_flight = 0
+        self.successes = 0
+        self.slow_streak = 0
+        self.cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    @property
+    def baseline(self):
+        """Median of the recent latencies (None until "patience" responses have been seen)"""
+        return median(self.latencies) if len(self.latencies) >= self.patience else None
+
+    def success(self, latency):
+        """Additive increase (or a one slot decrease after sustained slowness)"""
+        baseline = self.baseline
+        self.latencies.append(latency)
+        if baseline is not None and latency > baseline * self.slow:
+            self.slow_streak += 1
+            if self.slow_streak >= self.patience:
+                self.limit = max(1, self.limit - 1)
+                self.slow_streak = 0
+                self.successes = 0
+            return
+        self.slow_streak = 0
+        self.successes += 1
+        if self.successes >= self.limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.successes = 0
+
+    def failure(self):
+        """Multiplicative decrease"""
+        self.limit = max(1, self.limit // 2)
+        self.successes = 0
+        self.slow_streak = 0
+
+
 class XtreamAPI:
     """MultiThreaded API For LemoIPTV and ChapoIPTV"""
+    LISTING_FIELDS = ("tvg_id", "epg_title", "epg_start", "epg_stop", "epg_desc")
+    # -- seconds of stored guide refreshEPG() expects per action (get_short_epg only returns the next few programmes)
+    EPG_HORIZONS = {"get_simple_data_table": 24 * 60 * 60, "get_short_epg": 60 * 60}
 
     def __init__(self):
         """Configs"""
@@ -54,17 +134,21 @@ class XtreamAPI:
         #exec(f'self.{iptv} = info')
         self.__dict__[iptv] = info
 
+    def indexCategories(self, cats):
+        """Map category_id -> category_name (built once per getM3U run)"""
+        return {c["category_id"]: c["category_name"] for c in cats}
+
     def genInfo(self, s):
         tvg_id = s["epg_channel_id"] if s.get("epg_channel_id") else ""
         tvg_name = s["name"] if s.get("name") else ""
         tvg_logo = s["stream_icon"] if s.get("stream_icon") else ""
-        tvg_group = next((c["category_name"] for c in self.cats if s["category_id"] == c["category_id"]), "")
+        tvg_group = self.cat_names.get(s["category_id"], "")
         return f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-name="{tvg_name}" tvg-logo="{tvg_logo}" group-title="{tvg_group}",{tvg_name}\n'
 
     def genM3U(self, s, iptv):
-        api_url = eval(f'self.{iptv}["api_url"]')
-        username = eval(f'self.{iptv}["username"]')
-        password = eval(f'self.{iptv}["password"]')
+        api_url = self.__dict__[iptv]["api_url"]
+        username = self.__dict__[iptv]["username"]
+        password = self.__dict__[iptv]["password"]
 
         if "panel_api" in api_url:
             return api_url.replace(
@@ -78,7 +162,9 @@ class XtreamAPI:
         )
 
     def process(self, r, iptv, **kwargs):
-        streams = r.json()
+        return self.processStreams(r.json(), iptv)
+
+    def processStreams(self, streams, iptv):
         self.__dict__[iptv]['streams'] += streams
         m3u_streams = []
         for s in streams:
@@ -95,28 +181,338 @@ class XtreamAPI:
         r = requests.get(url=api_url, params=payload)
         return list(filter(lambda x: x["category_name"] in groups, r.json()))
 
-    def parseCategories(self, extract_categories, iptv):
-        self.m3u_items = ["#EXTM3U\n"]
-        api_url = eval(f'self.{iptv}["api_url"]')
-        p = eval(f'self.{iptv}["params"]')
-        p.update({"action": "get_live_streams"})
+    def iterCategories(self, extract_categories, iptv, size=8):
+        """Yield M3U lines category by category as each get_live_streams response arrives"""
+        api_url = self.__dict__[iptv]["api_url"]
+        p = dict(self.__dict__[iptv]["params"], action="get_live_streams")
         categories = [dict(**p, **{"category_id": c["category_id"]}) for c in self.cats]
+        self.__dict__[iptv]['categories'] = categories if extract_categories else None
+
+        # -- grequests gevent-patches queue/socket on import, which deadlocks ThreadPoolExecutor workers
+        # -- (SonarrAPI.iterHistory, RequestsAPI.bulk) for the rest of the process: only load it when used
+        import grequests
 
-        batch_size = 8
-        payloads = [categories[i:i+batch_size] for i in range(0, len(categories), batch_size)]
-        for batch in payloads:
-            gs = (grequests.get(api_url, params=payload, stream=False) for payload in batch)
-            self.m3u_items += list(chain(*(self.process(r, iptv) for r in grequests.map(gs))))
+        yield "#EXTM3U\n"
+        gs = (grequests.get(api_url, params=payload, stream=False) for payload in categories)
+        for r in grequests.imap(gs, size=size):
+            yield from self.process(r, iptv)
 
+    def parseCategories(self, extract_categories, iptv):
+        self.m3u_items = list(self.iterCategories(extract_categories, iptv))
         self.m3u = "".join(self.m3u_items)
-        self.__dict__[iptv]['categories'] = categories if extract_categories else None
         return self.m3u
 
+    def iterM3U(self, extract_categories=False, iptv=''):
+        """
+        Generator version of getM3U() for streaming responses
+
+        Example (bottle):
+            @route('/lemo_m3u')
+            def lemo_m3u():
+                return XtreamAPI().iterM3U(iptv="lemo")
+        """
+        self.setup(iptv)
+        self.cats = self.getCategories(iptv)
+        self.cat_names = self.indexCategories(self.cats)
+        yield from self.iterCategories(extract_categories, iptv)
+
     def getM3U(self, extract_categories=False, iptv=''):
         self.setup(iptv)
         self.cats = self.getCategories(iptv)
+        self.cat_names = self.indexCategories(self.cats)
         return self.parseCategories(extract_categories, iptv)
 
+    async def afetch(self, session, semaphore, api_url, payload):
+        """Fetch a single player_api.php action, bounded by the shared semaphore"""
+        async with semaphore:
+            async with session.get(api_url, params=payload) as r:
+                r.raise_for_status()
+                # -- panels often answer with "text/html" so skip the content-type check
+                return await r.json(content_type=None)
+
+    async def agetCategories(self, session, semaphore, iptv):
+        """Get All Categories in Matching Groups (asyncio)"""
+        api_url = self.__dict__[iptv]["api_url"]
+        groups = self.__dict__[iptv]["groups"]
+        payload = dict(self.__dict__[iptv]["params"], action="get_live_categories")
+        categories = await self.afetch(session, semaphore, api_url, payload)
+        return list(filter(lambda x: x["category_name"] in groups, categories))
+
+    async def aparseCategories(self, session, semaphore, extract_categories, iptv):
+        """
+        Fetch every category concurrently and append streams in completion order
+
+        A slow category only delays its own streams instead of stalling a whole batch.
+        """
+        self.m3u_items = ["#EXTM3U\n"]
+        api_url = self.__dict__[iptv]["api_url"]
+        p = dict(self.__dict__[iptv]["params"], action="get_live_streams")
+        categories = [dict(**p, **{"category_id": c["category_id"]}) for c in self.cats]
+
+        tasks = [self.afetch(session, semaphore, api_url, payload) for payload in categories]
+        for task in asyncio.as_completed(tasks):
+            try:
+                streams = await task
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.error(f'get_live_streams failed: {e}')
+                continue
+            self.m3u_items += self.processStreams(streams, iptv)
+
+        self.m3u = "".join(self.m3u_items)
+        self.__dict__[iptv]['categories'] = categories if extract_categories else None
+        return self.m3u
+
+    async def afetchListings(self, session, limiter, api_url, payload, retries=3, backoff=1.0):
+        """Fetch one stream's EPG listings through the limiter, retrying 429/5xx/timeouts with backoff"""
+        for attempt in range(retries + 1):
+            retry_after = None
+            async with limiter:
+                start = time.monotonic()
+                try:
+                    async with session.get(api_url, params=payload) as r:
+                        if r.status == 429 or r.status >= 500:
+                            retry_after = r.headers.get("Retry-After")
+                            raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status,
+                                                              message=r.reason)
+                        r.raise_for_status()
+                        data = await r.json(content_type=None)
+                        limiter.success(time.monotonic() - start)
+                        return data.get("epg_listings", []) if isinstance(data, dict) else []
+                except aiohttp.ClientResponseError as e:
+                    if e.status != 429 and e.status < 500:
+                        raise
+                    limiter.failure()
+                    error = e
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    limiter.failure()
+                    error = e
+            if attempt == retries:
+                raise error
+            # -- sleep outside the limiter so the slot goes to someone else
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def aiterListings(self, streams=[], iptv='', action="get_short_epg", limit=4, max_limit=32, retries=3,
+                            backoff=1.0, timeout=30):
+        """
+        Fetch EPG listings for many streams with a sliding-window, self-tuning async pool
+
+        A new request starts as soon as any finishes (no batches); the number in flight
+        grows while the provider answers quickly and halves on 429/5xx/timeouts (see AdaptiveLimiter).
+        Each stream's listings are yielded as soon as its request completes, so callers can write
+        the guide while the rest are still downloading.
+
+        Args:
+            Required - streams (list) - stream dicts (with "stream_id") or stream ids
+            Required - iptv (str) - config section name (ex: "lemo", "lemo2")
+            Optional - action (str) - "get_short_epg" or "get_simple_data_table"
+            Optional - limit (int) - starting number of requests in flight
+            Optional - max_limit (int) - max number of requests in flight (and pooled connections per host)
+            Optional - retries (int) - attempts after the first for 429/5xx/timeouts
+            Optional - backoff (float) - base seconds for exponential backoff (Retry-After wins when sent)
+            Optional - timeout (int) - total seconds allowed for each request
+        Returns:
+            async generator of (stream_id, epg_listings) in completion order; streams that still fail
+            are logged and skipped (self.epg_limit holds the final concurrency once exhausted)
+        """
+        if iptv not in self.__dict__:
+            self.setup(iptv)
+        api_url = self.__dict__[iptv]["api_url"]
+        params = dict(self.__dict__[iptv]["params"], action=action)
+        stream_ids = [s.get("stream_id") if isinstance(s, dict) else s for s in streams]
+
+        limiter = AdaptiveLimiter(limit=limit, max_limit=max_limit)
+        connector = aiohttp.TCPConnector(limit_per_host=max_limit)
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            async def fetch(stream_id):
+                payload = dict(params, stream_id=stream_id)
+                listings = await self.afetchListings(session, limiter, api_url, payload, retries=retries,
+                                                     backoff=backoff)
+                return stream_id, listings
+
+            tasks = [asyncio.ensure_future(fetch(stream_id)) for stream_id in stream_ids]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    try:
+                        stream_id, listings = await task
+                    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                        log.error(f'{action} failed: {e}')
+                        continue
+                    yield stream_id, listings
+            finally:
+                # -- the caller stopped early: don't leave requests running against a closed session
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self.epg_limit = limiter.limit
+
+    async def afetchEPG(self, streams=[], iptv='', action="get_short_epg", **kwargs):
+        """
+        Collect aiterListings() into a dict
+
+        Returns:
+            dict - {stream_id: epg_listings}; streams that still fail are logged and left out
+        """
+        listings = self.aiterListings(streams, iptv=iptv, action=action, **kwargs)
+        return {stream_id: epg_listings async for stream_id, epg_listings in listings}
+
+    def iterListings(self, streams=[], iptv='', action="get_short_epg", **kwargs):
+        """
+        Blocking generator over aiterListings() (runs its own event loop)
+
+        Example:
+            xtream = XtreamAPI()
+            with open("epg.xml", "wb") as f:
+                programs = (xtream.normalizeListings(listings, epg_fmt=True)
+                            for _, listings in xtream.iterListings(stream_ids, iptv="lemo"))
+                XMLTVWriter(f).write(channels, chain.from_iterable(programs))
+        """
+        loop = asyncio.new_event_loop()
+        listings = self.aiterListings(streams, iptv=iptv, action=action, **kwargs)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(listings.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(listings.aclose())
+            loop.close()
+
+    def fetchEPG(self, streams=[], iptv='', action="get_short_epg", **kwargs):
+        """
+        Blocking wrapper around afetchEPG()
+
+        Example:
+            xtream = XtreamAPI()
+            xtream.getM3U(iptv="lemo")
+            epg = xtream.fetchEPG(xtream.lemo["streams"], iptv="lemo", action="get_simple_data_table")
+        """
+        return asyncio.run(self.afetchEPG(streams, iptv=iptv, action=action, **kwargs))
+
+    def decode(self, value):
+        """Base64 listing field -> str (undecodable values pass through)"""
+        try:
+            return a2b_base64(value).decode(errors="ignore") if value else ""
+        except (B64Error, ValueError):
+            return value
+
+    def listingTimes(self, listings):
+        """(starts, stops) epoch seconds for a listings array (one vectorized parse when timestamps are missing)"""
+        try:
+            return [int(i["start_timestamp"]) for i in listings], [int(i["stop_timestamp"]) for i in listings]
+        except (KeyError, TypeError, ValueError):
+            epoch = pd.Timestamp(0, tz="UTC")
+            starts = pd.to_datetime(pd.Series([i["start"] for i in listings]), utc=True)
+            stops = pd.to_datetime(pd.Series([i.get("end") or i.get("stop") for i in listings]), utc=True)
+            second = pd.Timedelta(seconds=1)
+            return ((starts - epoch) // second).tolist(), ((stops - epoch) // second).tolist()
+
+    def normalizeListings(self, listings, epg_fmt=False, columnar=False):
+        """
+        Normalize a whole get_short_epg / get_simple_data_table "epg_listings" array in one pass
+
+        Args:
+            Required - listings (list, dict, str, bytes) - the listings, the response dict,
+                                                          or the raw response body (parsed once)
+            Optional - epg_fmt (bool) - start/stop as XMLTV strings (US/Eastern) instead of epoch ints
+            Optional - columnar (bool) - return {field: [values]} instead of tuples
+        Returns:
+            [(tvg_id, epg_title, epg_start, epg_stop, epg_desc), ...] (see LISTING_FIELDS)
+
+        Example:
+            rows = xtream.normalizeListings(r.content, epg_fmt=True)
+            XMLTVWriter(f).write(channels, rows)
+        """
+        if isinstance(listings, (str, bytes)):
+            listings = json.loads(listings)
+        if isinstance(listings, dict):
+            listings = listings.get("epg_listings") or []
+        if not listings:
+            return {k: [] for k in self.LISTING_FIELDS} if columnar else []
+
+        decode = self.decode
+        tvg_ids = [i.get("channel_id", "") for i in listings]
+        titles = [decode(i.get("title")) for i in listings]
+        descs = [decode(i.get("description")) for i in listings]
+        starts, stops = self.listingTimes(listings)
+        if epg_fmt:
+            starts = [formatEPGTime(t, epg_fmt=True) for t in starts]
+            stops = [formatEPGTime(t, epg_fmt=True) for t in stops]
+
+        columns = (tvg_ids, titles, starts, stops, descs)
+        return dict(zip(self.LISTING_FIELDS, columns)) if columnar else list(zip(*columns))
+
+    def refreshEPG(self, iptv='', streams=None, action="get_simple_data_table", horizon=None, store=None, **kwargs):
+        """
+        Incremental fetchEPG(): only streams whose stored guide ends before the horizon
+        (or whose metadata changed since the last getM3U) are requested again
+
+        The horizon has to be one the action can reach: get_simple_data_table returns the full guide
+        (a day or more), while get_short_epg only returns the next few programmes, so with it the
+        default horizon drops to an hour and streams are refetched every time their stored guide
+        gets within an hour of running out.
+
+        Args:
+            Required - iptv (str) - config section name (ex: "lemo", "lemo2")
+            Optional - streams (list) - stream dicts (default: self.<iptv>["streams"] from getM3U)
+            Optional - action (str) - "get_simple_data_table" (default) or "get_short_epg"
+            Optional - horizon (int) - seconds of guide each stream should already cover
+                                       (default: EPG_HORIZONS[action])
+            Optional - store (EPGStore) - where listings persist between runs (default: ~/.cache/plexarr/epg.db)
+            Optional - kwargs - passed on to fetchEPG (limit, max_limit, retries, ...)
+        Returns:
+            dict - {stream_id: epg_listings} for every requested stream, current and upcoming only
+
+        Example:
+            xtream = XtreamAPI()
+            xtream.getM3U(iptv="lemo")
+            epg = xtream.refreshEPG(iptv="lemo")
+        """
+        if iptv not in self.__dict__:
+            self.setup(iptv)
+        store = store if store is not None else EPGStore()
+        api_url = self.__dict__[iptv]["api_url"]
+        streams = self.__dict__[iptv]["streams"] if streams is None else streams
+        horizon = self.EPG_HORIZONS.get(action, 60 * 60) if horizon is None else horizon
+        stale = store.stale(api_url, streams, horizon=horizon)
+        by_id = {str(s.get("stream_id") if isinstance(s, dict) else s): s for s in stale}
+
+        fetched = self.fetchEPG(stale, iptv=iptv, action=action, **kwargs)
+        for stream_id, listings in fetched.items():
+            store.update(api_url, by_id[str(stream_id)], listings)
+        self.epg_refreshed = len(fetched)
+
+        now = int(time.time())
+        stream_ids = [s.get("stream_id") if isinstance(s, dict) else s for s in streams]
+        return store.listings(api_url, stream_ids=stream_ids, start=now)
+
+    async def agetM3U(self, extract_categories=False, iptv='', limit=8, timeout=60):
+        """
+        Asyncio version of getM3U()
+
+        Args:
+            Optional - extract_categories (bool) - keep the category payloads on self.<iptv>
+            Required - iptv (str) - config section name (ex: "lemo", "lemo2")
+            Optional - limit (int) - max number of requests in flight (and pooled connections per host)
+            Optional - timeout (int) - total seconds allowed for each request
+        Returns:
+            M3U String
+
+        Example:
+            xtream = XtreamAPI()
+            m3u = asyncio.run(xtream.agetM3U(iptv="lemo"))
+        """
+        self.setup(iptv)
+        semaphore = asyncio.Semaphore(limit)
+        connector = aiohttp.TCPConnector(limit_per_host=limit)
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            self.cats = await self.agetCategories(session, semaphore, iptv)
+            self.cat_names = self.indexCategories(self.cats)
+            return await self.aparseCategories(session, semaphore, extract_categories, iptv)
+
 
 
 
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import pytest
+
+from plexarr.espn_api import getTeamMatcher
+from plexarr.utils import read_csv
+
+DATA = Path(__file__).parent.parent.joinpath("plexarr", "data")
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    df_teams = read_csv(DATA.joinpath("nfl_teams_2024.csv"))
+    return getTeamMatcher(tuple(df_teams.team_name), tuple(df_teams.team_nick))
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("USA NFL Sunday 705: Las Vegas Raiders vs Minnesota Vikings @ 04:25 PM",
+     ("USA NFL Sunday 705", "Las Vegas Raiders", "Minnesota Vikings", "04:25 PM")),
+    ("USA NFL Sunday Night: Cincinnati Bengals vs Los Angeles Rams @ 06:30 PM",
+     ("USA NFL Sunday Night", "Cincinnati Bengals", "Los Angeles Rams", "06:30 PM")),
+    ("USA NFL Sunday 705: Philadelphia Eagles vs  Cleveland Browns @ 01:00 PM",
+     ("USA NFL Sunday 705", "Philadelphia Eagles", "Cleveland Browns", "01:00 PM")),
+    ("USA NFL Sunday 707: Arizona Cardinals vs Baltimore Ravens (08:00 PM)",
+     ("USA NFL Sunday 707", "Arizona Cardinals", "Baltimore Ravens", "08:00 PM")),
+    ("USA NFL Monday Night: New York Jets at New York Giants @ 08:15 PM",
+     ("USA NFL Monday Night", "New York Jets", "New York Giants", "08:15 PM")),
+    ("USA NFL Sunday 705: Philadelphia Eagles vs  Browns @ 01:00 PM",
+     ("USA NFL Sunday 705", "Philadelphia Eagles", "Cleveland Browns", "01:00 PM")),
+])
+def test_parse_stream_names(matcher, line, expected):
+    info = matcher.parse(line)
+    assert (info["tvg_name"], info["team1"], info["team2"], info["time"]) == expected
+
+
+@pytest.mark.parametrize("line", ["USA NFL Sunday 708:", "USA NFL Sunday 708"])
+def test_parse_without_teams(matcher, line):
+    with pytest.raises(ValueError):
+        matcher.parse(line)
+
+
+def test_getTeamMatcher_is_cached(matcher):
+    df_teams = read_csv(DATA.joinpath("nfl_teams_2024.csv"))
+    assert getTeamMatcher(tuple(df_teams.team_name), tuple(df_teams.team_nick)) is matcher
@@ -0,0 +1,39 @@
+from plexarr.radarr_api import RadarrAPI, RadarrIndex
+from plexarr.requests_api import RequestsAPI
+
+
+class FakeRadarr(RadarrAPI):
+    """RadarrAPI without a config file or server: /movie and /command are canned"""
+    def __init__(self, movies):
+        RequestsAPI.__init__(self, api_url="http://localhost:7878/api/v3/", api_key="key")
+        self.index = RadarrIndex(self)
+        self.library, self.pulls, self.posted = movies, 0, []
+
+    def getMovies(self):
+        self.pulls += 1
+        return [dict(movie) for movie in self.library]
+
+    def post(self, path, data={}, check=False):
+        self.posted.append((path, data))
+        return {"id": len(self.posted), "name": data.get("name"), "status": "queued"}
+
+
+def test_importDownloadedMovie_invalidates_index():
+    radarr = FakeRadarr([{"id": 1, "title": "Heat", "year": 1995}])
+    assert radarr.index.getMovie(title="Heat (1995)")["id"] == 1
+    radarr.library.append({"id": 2, "title": "The Manifest", "year": 2017})
+    assert radarr.index.getMovie(title="The Manifest (2017)") is None  # -- served from the TTL-bound index
+
+    radarr.importDownloadedMovie("/downloads/The.Manifest.2017.1080p")
+    assert radarr.posted[0][1]["name"] == "DownloadedMoviesScan"
+    assert radarr.index.getMovie(title="The Manifest (2017)")["id"] == 2
+    assert radarr.pulls == 2
+
+
+def test_commandFinished_invalidates_index():
+    radarr = FakeRadarr([{"id": 1, "title": "Heat", "year": 1995}])
+    radarr.index.refresh()
+    for name, pulls in (("RefreshMonitoredDownloads", 1), ("RenameMovie", 2), ("DownloadedMoviesScan", 3)):
+        radarr.commandFinished(radarr.trackCommand({"id": 9, "name": name, "status": "completed"}))
+        radarr.index.refresh()
+        assert radarr.pulls == pulls
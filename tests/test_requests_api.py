@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+import requests
+
+from plexarr import requests_api
+from plexarr.requests_api import RequestsAPI
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+def flaky(*errors):
+    """func for bulk(): raises each error in turn, then returns the number of calls"""
+    calls = []
+
+    def func(item):
+        calls.append(item)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return len(calls)
+    return func, calls
+
+
+@pytest.fixture
+def api():
+    return RequestsAPI(api_url="http://localhost:8989/api/v3/", api_key="key")
+
+
+@pytest.mark.parametrize("error", [
+    requests.ConnectionError(), requests.ReadTimeout(), http_error(500), ValueError("bad json"),
+])
+def test_bulk_retries_idempotent_requests(api, error):
+    func, calls = flaky(error)
+    assert api.bulk(func, ["a"], retries=2, backoff=0) == [2]
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("error", [requests.ConnectionError(), requests.ConnectTimeout(), http_error(503)])
+def test_bulk_retries_unsent_posts(api, error):
+    func, calls = flaky(error)
+    assert api.bulk(func, ["a"], retries=2, backoff=0, idempotent=False) == [2]
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("error", [requests.ReadTimeout(), http_error(500), ValueError("bad json")])
+def test_bulk_never_repeats_posts_the_server_may_have_run(api, error):
+    func, calls = flaky(error)
+    assert api.bulk(func, ["a"], retries=2, backoff=0, idempotent=False) == [error]
+    assert len(calls) == 1
+
+
+def command(command_id, status):
+    return {"id": command_id, "name": "DownloadedEpisodesScan", "status": status}
+
+
+class FakeCommands(RequestsAPI):
+    """RequestsAPI whose /command list and /command/{id} replies are scripted"""
+    def __init__(self, listed=(), single={}):
+        super().__init__(api_url="http://localhost:8989/api/v3/", api_key="key")
+        self.listed = list(listed)  # -- one GET /command reply per poll
+        self.single = {k: list(v) for k, v in single.items()}  # -- GET /command/{id} replies (exceptions raise)
+        self.calls, self.finished = [], []
+
+    def get(self, path, data={}):
+        self.calls.append(path)
+        if path == "/command":
+            return self.listed.pop(0) if self.listed else []
+        reply = self.single[int(path.rsplit("/", 1)[1])].pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def commandFinished(self, handle):
+        self.finished.append(handle.id)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(requests_api.time, "sleep", delays.append)
+    return delays
+
+
+def test_waitCommands_batches_polls(sleeps):
+    api = FakeCommands(
+        listed=[
+            [command(1, "started"), command(2, "started"), command(4, "failed")],
+            [command(1, "started")],
+            [command(1, "completed")],
+        ],
+        single={2: [command(2, "completed")], 3: [ValueError("404 Not Found")]},
+    )
+    handles = [api.trackCommand(command(i, "queued")) for i in range(1, 5)]
+    stats = api.waitCommands(handles, initial=0.5)
+
+    # -- one list call per poll; ids missing from the list are refreshed one by one
+    assert api.calls == ["/command", "/command/3", "/command", "/command/2", "/command"]
+    assert [h.status for h in handles] == ["completed", "completed", "unknown", "failed"]
+    assert api.finished == [3, 4, 2, 1]
+    assert sleeps == [0.5, 0.5]
+    assert {k: stats[k] for k in ("commands", "completed", "failed", "unknown", "pending", "polls", "requests")} == {
+        "commands": 4, "completed": 2, "failed": 1, "unknown": 1, "pending": 0, "polls": 3, "requests": 5,
+    }
+
+
+def test_waitCommands_backs_off_while_nothing_finishes(sleeps):
+    api = FakeCommands(listed=[[command(1, "started")]] * 5 + [[command(1, "completed")]])
+    api.waitCommands([api.trackCommand(command(1, "queued"))], initial=0.5, maximum=4.0)
+    assert sleeps == [1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_waitCommands_timeout_leaves_pending(sleeps):
+    api = FakeCommands(listed=[[command(1, "started"), command(2, "completed")]])
+    stats = api.waitCommands([api.trackCommand(command(i, "queued")) for i in (1, 2)], timeout=0)
+    assert (stats["completed"], stats["pending"], stats["polls"]) == (1, 1, 1)
+    assert sleeps == []
+
+
+def test_waitCommands_skips_finished_handles(sleeps):
+    api = FakeCommands()
+    stats = api.waitCommands([api.trackCommand(command(1, "completed"))])
+    assert api.calls == [] and stats["polls"] == 0
+
+
+def test_waitAsync():
+    api = FakeCommands(single={1: [command(1, "started"), {"message": "NotFound"}],
+                               2: [command(2, "started"), command(2, "completed")]})
+    first, second = api.trackCommand(command(1, "queued")), api.trackCommand(command(2, "queued"))
+
+    async def run():
+        return await first.waitAsync(initial=0), await second
+
+    assert asyncio.run(run()) == (command(1, "unknown"), command(2, "completed"))
+    assert api.finished == [1, 2]
@@ -0,0 +1,142 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from plexarr.requests_api import RequestsAPI
+from plexarr.sonarr_api import SonarrAPI, SonarrIndex
+
+
+class FakeSonarr(SonarrAPI):
+    """SonarrAPI without a config file or server: /series and /history/since are canned"""
+    def __init__(self, series=()):
+        RequestsAPI.__init__(self, api_url="http://localhost:8989/api/v3/", api_key="key")
+        self.index = SonarrIndex(self)
+        self.library = {show["id"]: show for show in series}
+        self.changed = []
+        self.history, self.pages, self.threads = [], [], set()
+
+    def getSeries(self):
+        return list(self.library.values())
+
+    def getShow(self, title='', series_id=-1):
+        if series_id >= 0:
+            return self.library.get(series_id, {"message": "NotFound"})
+        return super().getShow(title=title)
+
+    def get(self, path, data={}):
+        if path == "/history/since":
+            return [{"seriesId": series_id} for series_id in self.changed]
+        assert path == "/history" and data["sortKey"] == "date"
+        self.pages.append((data["page"], data.get("sortDirection")))
+        self.threads.add(threading.get_ident())
+        records = sorted(self.history, key=lambda r: r["id"], reverse=data.get("sortDirection") == "descending")
+        size = data["pageSize"]
+        page = records[(data["page"] - 1) * size:data["page"] * size]
+        return {"page": data["page"], "pageSize": size, "totalRecords": len(records), "records": page}
+
+
+def test_index_matches_normalized_titles():
+    sonarr = FakeSonarr([{"id": 1, "title": "The Office (US)", "tvdbId": 73244},
+                         {"id": 2, "title": "Law & Order: SVU"}])
+    assert sonarr.getShow(title="the office us")["id"] == 1
+    assert sonarr.index.getSeriesID(title="Law and Order SVU") == 2
+    assert sonarr.index.getSeriesID(tvdb_id=73244) == 1
+    assert sonarr.index.getSeriesID(title="The Office (UK)") is None
+
+
+def test_index_forgets_old_title_on_rename():
+    sonarr = FakeSonarr([{"id": 1, "title": "Picard", "tvdbId": 364093}])
+    sonarr.index.refresh()
+    sonarr.index.sync()
+    sonarr.library[1] = {"id": 1, "title": "Star Trek: Picard", "tvdbId": 364093}
+    sonarr.changed = [1]
+    sonarr.index.sync()
+    assert sonarr.index.getSeriesID(title="Star Trek: Picard") == 1
+    assert sonarr.index.getSeriesID(title="Picard") is None
+    assert sonarr.index.getSeriesID(tvdb_id=364093) == 1
+
+    sonarr.index.add({"id": 1, "title": "Picard"})  # -- and without a tvdbId any more
+    assert sonarr.index.getSeriesID(title="Star Trek: Picard") is None
+    assert sonarr.index.getSeriesID(tvdb_id=364093) is None
+    assert sonarr.index.getSeriesID(title="Picard") == 1
+
+
+def test_index_rename_keeps_keys_owned_by_other_series():
+    index = FakeSonarr().index
+    index.add({"id": 1, "title": "Shameless"})
+    index.add({"id": 2, "title": "Shameless (US)"})
+    index.add({"id": 3, "title": "shameless"})  # -- same normalized key, now owned by 3
+    index.add({"id": 1, "title": "Shameless (UK)"})
+    assert index.titles == {"shameless": 3, "shameless us": 2, "shameless uk": 1}
+
+
+def test_index_sync_drops_deleted_series():
+    sonarr = FakeSonarr([{"id": 1, "title": "Heroes"}])
+    sonarr.index.refresh()
+    sonarr.index.sync()
+    del sonarr.library[1]
+    sonarr.changed = [1]
+    sonarr.index.sync()
+    assert sonarr.index.getSeriesID(title="Heroes") is None
+
+
+def grab(history_id):
+    quality = {"name": "WEBDL-1080p", "resolution": 1080, "source": "web"}
+    return {"id": history_id, "date": f"2024-01-{history_id:02d}T00:00:00Z", "eventType": "grabbed",
+            "data": {"indexer": f"indexer{history_id % 2}", "releaseGroup": "NTb"}, "quality": {"quality": quality}}
+
+
+@pytest.fixture
+def sonarr():
+    sonarr = FakeSonarr()
+    sonarr.history = [grab(i) for i in range(1, 24)]
+    return sonarr
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_iterHistory_walks_every_page(sonarr, workers):
+    records = sonarr.iterHistory(page_size=5, workers=workers, sort_direction="ascending")
+    assert [r["id"] for r in records] == list(range(1, 24))
+    assert sorted(sonarr.pages) == [(page, "ascending") for page in range(1, 6)]
+
+
+def test_iterHistory_parallel_pages_stay_in_order(sonarr):
+    sonarr.history = [grab(i) for i in range(1, 200)]
+    records = sonarr.iterHistory(page_size=3, workers=8, sort_direction="ascending")
+    assert [r["id"] for r in records] == list(range(1, 200))
+    assert len(sonarr.pages) == 67
+    assert len(sonarr.threads) > 1
+
+
+def test_iterHistory_parallel_stops_early(sonarr):
+    records = sonarr.iterHistory(page_size=5, workers=2)
+    assert next(records)["id"] == 1
+    records.close()  # -- pending pages are cancelled rather than left running
+
+
+def test_iterHistory_since_id(sonarr):
+    records = list(sonarr.iterHistory(page_size=5, workers=4, since_id=15, sort_direction="ascending"))
+    assert [r["id"] for r in records] == list(range(23, 15, -1))
+    assert sonarr.pages == [(1, "descending"), (2, "descending")]  # -- newest first, no pages past since_id
+
+
+def test_iterHistory_since_id_nothing_new(sonarr):
+    assert list(sonarr.iterHistory(page_size=5, since_id=23)) == []
+    assert sonarr.pages == [(1, "descending")]
+
+
+def test_getIndexerStats(sonarr):
+    df = sonarr.getIndexerStats(page_size=5, workers=3)
+    assert isinstance(df, pd.DataFrame)
+    assert list(df.columns) == ["date", "indexer", "release_groups", "quality", "resolution", "source_types"]
+    assert df["date"].tolist() == [grab(i)["date"] for i in range(1, 24)]
+    assert sonarr.history_last_id == 23
+
+    sonarr.history += [grab(24), grab(25)]
+    df = sonarr.getIndexerStats(since_id=sonarr.history_last_id, page_size=5)
+    assert df["indexer"].tolist() == ["indexer0", "indexer1"]  # -- oldest first
+    assert sonarr.history_last_id == 25
+
+    assert sonarr.getIndexerStats(since_id=25).empty
+    assert sonarr.history_last_id == 25
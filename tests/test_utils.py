@@ -0,0 +1,334 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import json
+import time
+
+import pandas as pd
+import pytest
+
+from plexarr.utils import (
+    ProgrammeStore, ResponseCache, convertEPGTime, convertEPGTimes, iter_m3u, m3u_to_json, mergeEPG, replaceLogos
+)
+
+SAMPLES = Path(__file__).parent
+
+
+def guide(*programs):
+    channels = sorted({channel for channel, _, _ in programs})
+    xml = ['<?xml version="1.0" encoding="UTF-8"?>', "<tv>"]
+    xml += [f'<channel id="{channel}"><display-name>{channel}</display-name></channel>' for channel in channels]
+    xml += [
+        f'<programme channel="{channel}" start="20220101{start:02d}0000 +0000" stop="20220101{stop:02d}0000 +0000">'
+        f"<title>{channel} {start}</title></programme>"
+        for channel, start, stop in programs
+    ]
+    return "\n".join(xml + ["</tv>"])
+
+
+def merged(*sources):
+    channels, programs = mergeEPG([guide(*source) for source in sources])
+    return [c["tvg_id"] for c in channels], [p["epg_title"] for p in programs]
+
+
+def test_mergeEPG_channel_grouped_sources():
+    channels, titles = merged([("X", 12, 13), ("Y", 10, 11)], [("Y", 11, 12)])
+    assert channels == ["X", "Y"]
+    assert titles == ["Y 10", "Y 11", "X 12"]
+
+
+def test_mergeEPG_drops_overlaps_by_priority():
+    _, titles = merged([("X", 10, 12), ("X", 14, 15)], [("X", 9, 10), ("X", 11, 13), ("X", 12, 14)])
+    assert titles == ["X 9", "X 10", "X 12", "X 14"]
+    _, titles = merged([("X", 10, 11)], [("X", 10, 12)])
+    assert titles == ["X 10"]
+
+
+def test_mergeEPG_keeps_program_fields():
+    _, programs = mergeEPG([guide(("X", 12, 13))])
+    assert list(programs) == [{
+        "tvg_id": "X",
+        "epg_title": "X 12",
+        "epg_start": "20220101120000 +0000",
+        "epg_stop": "20220101130000 +0000",
+        "epg_desc": "",
+    }]
+
+
+def test_mergeEPG_clips_to_window():
+    _, programs = mergeEPG(
+        [guide(("X", 8, 10), ("X", 10, 12), ("X", 12, 14), ("X", 14, 16))],
+        start="20220101090000 +0000", stop="20220101130000 +0000",
+    )
+    assert [(p["epg_start"][8:12], p["epg_stop"][8:12]) for p in programs] == [
+        ("0900", "1000"), ("1000", "1200"), ("1200", "1300")
+    ]
+
+
+def test_mergeEPG_streams_generator_sources():
+    consumed = {"lemo": 0, "kemo": 0}
+
+    def chunks(name, channels, hours=24 * 30):
+        # -- one chunk per element, programmes in time order across channels
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n<tv>\n'
+        for channel in channels:
+            yield f'<channel id="{channel}"><display-name>{channel}</display-name></channel>\n'
+        for hour in range(hours):
+            for channel in channels:
+                consumed[name] += 1
+                start, stop = (time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(1640995200 + h * 3600))
+                               for h in (hour, hour + 1))
+                yield f'<programme channel="{channel}" start="{start}" stop="{stop}">'
+                yield f"<title>{name}</title></programme>\n"
+        yield "</tv>\n"
+
+    channels, programs = mergeEPG([chunks("lemo", ["A", "B"]), chunks("kemo", ["B", "C"])])
+    assert [c["tvg_id"] for c in channels] == ["A", "B", "C"]
+    first = [next(programs) for _ in range(3)]
+    assert [(p["tvg_id"], p["epg_title"]) for p in first] == [("A", "lemo"), ("B", "lemo"), ("C", "kemo")]
+    assert consumed["lemo"] < 2 * 24 * 30 and consumed["kemo"] < 2 * 24 * 30
+    assert len(first) + sum(1 for _ in programs) == 3 * 24 * 30
+
+
+@pytest.mark.parametrize("sample, count", [
+    ("sample_lemo.m3u", 9),
+    ("sample_chapo.m3u", 9),
+    ("sample_xtream_lemo.m3u", 9),
+    ("sample_xtream_chapo.m3u", 9),
+    ("sample_1.m3u", 4),
+    ("sample_2.m3u", 5),
+    ("sample_3.m3u", 0),
+    ("sample_4.m3u", 0),
+])
+def test_iter_m3u_samples(sample, count):
+    streams = list(iter_m3u(SAMPLES / sample))
+    assert len(streams) == count
+    assert all(stream["url"].startswith("http") and stream["stream_id"] for stream in streams)
+
+
+def test_iter_m3u_xtream_record():
+    # -- "#EXT-X-SESSION-DATA" header lines are skipped, ids come from the stream url
+    stream = next(iter_m3u(SAMPLES / "sample_lemo.m3u"))
+    assert stream == {
+        "tvg-id": "aande.us",
+        "tvg-name": "USA A&E UHD",
+        "tvg-logo": "http://ky-iptv.com:80/images/99c72d95a86eff2ae1aa0246e6e5833b.png",
+        "group-title": "USA Entertainment",
+        "title": "USA A&E UHD",
+        "duration": -1,
+        "url": "http://line.lemotv.cc:80/TXXXXXXXX22/34XXXXXXX67/175784.m3u8",
+        "stream_id": "175784",
+    }
+
+
+def test_iter_m3u_sources_agree():
+    path = SAMPLES / "sample_xtream_chapo.m3u"
+    streams = list(iter_m3u(path))
+    assert streams[-1]["title"] == "USA: AMC+"     # -- trailing "#EXTINF" without a url is dropped
+    with open(path, "rb") as f:
+        assert list(iter_m3u(f)) == streams
+    assert list(iter_m3u(path.read_text())) == streams
+    assert list(iter_m3u(str(path))) == streams
+
+
+def test_iter_m3u_extra_lines():
+    src = (
+        '#EXTM3U x-tvg-url="http://epg/guide.xml"\n'
+        '#EXTINF:-1 tvg-id="a" group-title="Sports, Live",A, the channel\n'
+        "#EXTVLCOPT:http-user-agent=VLC\n"
+        "#EXTGRP:Sports\n"
+        "\n"
+        "http://iptv/live/u/p/101.ts?token=1\n"
+        "#EXTINF:10.5,B\n"
+        "http://iptv/102.m3u8\n"
+    )
+    header = {}
+    streams = list(iter_m3u(src, header=header))
+    assert header == {"x-tvg-url": "http://epg/guide.xml"}
+    first, second = streams
+    assert (first["title"], first["group-title"], first["stream_id"]) == ("A, the channel", "Sports, Live", "101")
+    assert (second["title"], second["duration"], second["stream_id"]) == ("B", 10, "102")
+
+
+XTEVE_M3U = """#EXTM3U
+#EXTINF:-1 tvg-id="1" tvg-logo="https://xteve/espn.png" group-title="Sports",ESPN
+http://xteve/stream/1
+#EXTINF:-1 tvg-id="2" tvg-logo="https://xteve/abc.png" group-title="Locals",ABC
+http://xteve/stream/2
+#EXTINF:-1 tvg-id="3" tvg-logo="" group-title="Locals",NBC
+http://xteve/stream/3
+"""
+
+IPTV_M3U = """#EXTM3U
+#EXTINF:-1 tvg-id="a" tvg-logo="https://iptv/shared.png" group-title="Sports",ESPN
+http://iptv/1.ts
+#EXTINF:-1 tvg-id="b" tvg-logo="https://iptv/shared.png" group-title="Sports",ESPN 2
+http://iptv/2.ts
+#EXTINF:-1 tvg-id="c" tvg-logo="" group-title="Locals",ABC
+http://iptv/3.ts
+#EXTINF:-1 tvg-id="d" tvg-logo="" group-title="Locals",CBS
+http://iptv/4.ts
+#EXTINF:-1 tvg-id="e" tvg-logo="https://iptv/nbc.png" group-title="Locals",NBC
+http://iptv/5.ts
+"""
+
+
+def test_replaceLogos_shared_and_empty_logos():
+    lines = replaceLogos(XTEVE_M3U, IPTV_M3U).splitlines()
+    assert 'tvg-logo="https://xteve/espn.png" group-title="Sports",ESPN' in lines[1]
+    assert 'tvg-logo="https://iptv/shared.png" group-title="Sports",ESPN 2' in lines[3]
+    assert 'tvg-logo="https://xteve/abc.png" group-title="Locals",ABC' in lines[5]
+    assert 'tvg-logo="" group-title="Locals",CBS' in lines[7]
+    assert 'tvg-logo="https://iptv/nbc.png" group-title="Locals",NBC' in lines[9]
+    assert lines[2::2] == IPTV_M3U.splitlines()[2::2]
+
+
+def test_replaceLogos_no_matches():
+    iptv_src = IPTV_M3U.replace(",ESPN", ",FOX").replace(",ABC", ",FOX")
+    assert replaceLogos(XTEVE_M3U, iptv_src) == iptv_src
+
+
+def test_m3u_to_json_sample():
+    streams = json.loads(m3u_to_json(SAMPLES / "sample_xtream_lemo.m3u"))["streams"]
+    assert len(streams) == 9
+    assert streams[0] == {
+        "ext_inf": "-1",
+        "tvg_id": "newsnation.us",
+        "tvg_name": "USA NewsNation",
+        "tvg_logo": "http://ky-iptv.com:80/images/aecce659d0e59a6d08add0325953fc88.png",
+        "group_title": "USA News",
+        "chan_name": "USA NewsNation",
+        "stream_url": "http://line.lemotv.cc:80/TXXXXXXXX22/34XXXXXXX67/175977.ts",
+    }
+
+
+def test_m3u_to_json_header_and_escaping():
+    src = (
+        '#EXTM3U url-tvg="http://epg/guide.xml"\n'
+        '#EXTINF:-1 tvg-id="a" group-title="Sports, Live",Team "A" \\ B\n'
+        "http://iptv/1.ts\n"
+    )
+    data = json.loads(m3u_to_json(src))
+    assert data["url_tvg"] == "http://epg/guide.xml"
+    assert data["streams"] == [{
+        "ext_inf": "-1",
+        "tvg_id": "a",
+        "group_title": "Sports, Live",
+        "chan_name": 'Team "A" \\ B',
+        "stream_url": "http://iptv/1.ts",
+    }]
+    assert json.loads(m3u_to_json("#EXTM3U\n")) == {"streams": []}
+
+
+XMLTV_TIMES = [
+    "20210803180000 +0000",
+    "20220218080000 +0000",
+    "20211107053000 +0000",     # -- 01:30 EDT, before the fall-back
+    "20211107063000 +0000",     # -- 01:30 EST, after it
+    "20211107055959 +0000",
+    "20240310065959 +0000",     # -- last second of EST
+    "20240310070000 +0000",     # -- 03:00 EDT
+    "20240310073000 +0200",
+    "20231231233000 -0530",
+]
+EPG_TIMES = XMLTV_TIMES + [
+    "2024-03-10T07:00:00Z",
+    "2021-11-07 06:30:00+00:00",
+    datetime(2021, 11, 7, 5, 30, tzinfo=timezone.utc),
+]
+
+
+def pandasEPGTime(p_time, epg_fmt=False):
+    est_dt = pd.to_datetime(p_time).tz_convert('US/Eastern')
+    return est_dt.strftime("%Y%m%d%H%M%S %z" if epg_fmt else "%Y-%m-%d %I:%M:%S %p")
+
+
+@pytest.mark.parametrize("p_time", EPG_TIMES)
+@pytest.mark.parametrize("epg_fmt", [False, True])
+def test_convertEPGTime_matches_pandas(p_time, epg_fmt):
+    assert convertEPGTime(p_time, epg_fmt=epg_fmt) == pandasEPGTime(p_time, epg_fmt=epg_fmt)
+
+
+@pytest.mark.parametrize("epg_fmt", [False, True])
+def test_convertEPGTimes_matches_pandas(epg_fmt):
+    expected = [pandasEPGTime(p_time, epg_fmt=epg_fmt) for p_time in XMLTV_TIMES]
+    assert convertEPGTimes(XMLTV_TIMES, epg_fmt=epg_fmt) == expected
+
+
+def test_convertEPGTime_dt_obj():
+    assert convertEPGTime("20211107063000 +0000", dt_obj=True) == pd.Timestamp("2021-11-07 01:30:00-0500")
+
+
+def test_ProgrammeStore_coerces_epochs():
+    store = ProgrammeStore([
+        {"tvg_id": "X", "epg_title": "float", "epg_start": 1641042000.0, "epg_stop": 1641045600.5},
+        {"tvg_id": "X", "epg_title": "digits", "epg_start": "1641045600", "epg_stop": "1641049200"},
+        {"tvg_id": "X", "epg_title": "xmltv", "epg_start": "20220101150000 +0000", "epg_stop": "20220101160000 +0000"},
+    ])
+    assert list(store.start) == [1641042000, 1641045600, 1641049200]
+    assert list(store.stop) == [1641045600, 1641049200, 1641052800]
+
+
+def test_ProgrammeStore_selectRows_windows():
+    hour = 3600
+    programs = [  # -- out of order, with one long programme on Y
+        {"tvg_id": "X", "epg_title": "X 2", "epg_start": 2 * hour, "epg_stop": 3 * hour},
+        {"tvg_id": "Y", "epg_title": "Y 0", "epg_start": 0, "epg_stop": 5 * hour},
+        {"tvg_id": "X", "epg_title": "X 0", "epg_start": 0, "epg_stop": hour},
+        {"tvg_id": "X", "epg_title": "X 1", "epg_start": hour, "epg_stop": 2 * hour},
+        {"tvg_id": "Y", "epg_title": "Y 5", "epg_start": 5 * hour, "epg_stop": 6 * hour},
+    ]
+    store = ProgrammeStore(programs)
+
+    def titles(*args, **kwargs):
+        return [store.title[row] for row in store.selectRows(*args, **kwargs)]
+
+    assert titles() == ["X 0", "Y 0", "X 1", "X 2", "Y 5"]  # -- ties keep channel order
+    assert titles(tvg_ids=["X"]) == ["X 0", "X 1", "X 2"]
+    assert titles(start=4 * hour) == ["Y 0", "Y 5"]
+    assert titles(start=hour + 1, stop=2 * hour) == ["Y 0", "X 1"]
+    assert titles(start=2 * hour, stop=3 * hour, tvg_ids=["X", "missing"]) == ["X 2"]
+    for start in range(0, 7 * hour, hour // 2):
+        expected = [p["epg_title"] for p in sorted(programs, key=lambda p: p["epg_start"]) if p["epg_stop"] > start]
+        assert sorted(titles(start=start)) == sorted(expected)
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data, self.status_code, self.headers = data, status_code, {}
+        self.text = json.dumps(data)
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    def __init__(self, *bodies):
+        self.bodies, self.calls = list(bodies), 0
+
+    def get(self, url, params=None, headers=None):
+        self.calls += 1
+        return FakeResponse(self.bodies.pop(0))
+
+
+@pytest.mark.parametrize("denied", [{"user_info": {"auth": 0}}, {"user_info": None}])
+def test_ResponseCache_skips_auth_failures(tmp_path, denied):
+    cache = ResponseCache(db_path=tmp_path / "responses.db")
+    cache.session = FakeSession(denied, {"user_info": {"auth": 1}}, {"stale": True})
+    params = {"username": "u", "password": "p", "action": ""}
+    assert cache.get("http://iptv/player_api.php", params=params) == denied
+    assert cache.get("http://iptv/player_api.php", params=params) == {"user_info": {"auth": 1}}
+    assert cache.get("http://iptv/player_api.php", params=params) == {"user_info": {"auth": 1}}
+    assert cache.session.calls == 2
+
+
+def test_ResponseCache_validate_override(tmp_path):
+    cache = ResponseCache(db_path=tmp_path / "responses.db")
+    cache.session = FakeSession([], [{"stream_id": 1}])
+    params = {"username": "u", "action": "get_live_streams"}
+    assert cache.get("http://iptv/player_api.php", params=params, validate=bool) == []
+    assert cache.get("http://iptv/player_api.php", params=params, validate=bool) == [{"stream_id": 1}]
+    assert cache.get("http://iptv/player_api.php", params=params, validate=bool) == [{"stream_id": 1}]
+    assert cache.session.calls == 2
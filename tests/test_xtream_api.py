@@ -0,0 +1,340 @@
+import asyncio
+import json
+import time
+from base64 import b64encode
+
+import aiohttp
+import pytest
+
+from plexarr import xtream_api
+from plexarr.utils import EPGStore
+from plexarr.xtream_api import AdaptiveLimiter, XtreamAPI
+
+API_URL = "http://iptv.test/player_api.php"
+real_sleep = asyncio.sleep  # -- the sleeps fixture patches asyncio.sleep
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=None, headers=None):
+        self.status, self.body, self.headers = status, body, headers or {}
+        self.reason, self.request_info, self.history = "status", None, ()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(self.request_info, self.history, status=self.status)
+
+    async def json(self, content_type=None):
+        return self.body
+
+
+class FakeSession:
+    """aiohttp.ClientSession stand-in: answers with the queued responses, then 200s"""
+    def __init__(self, *responses, limiter=None, latency=0):
+        self.responses, self.limiter, self.latency = list(responses), limiter, latency
+        self.calls, self.in_flight, self.peaks = 0, 0, []
+
+    def get(self, url, params=None):
+        session = self
+
+        class Request:
+            async def __aenter__(self):
+                session.calls += 1
+                session.in_flight += 1
+                if session.limiter is not None:
+                    session.peaks.append((session.in_flight, session.limiter.limit))
+                await real_sleep(session.latency)
+                session.in_flight -= 1
+                response = session.responses.pop(0) if session.responses else None
+                if isinstance(response, Exception):
+                    raise response
+                return response or FakeResponse(body={"epg_listings": [{"id": params["stream_id"]}]})
+
+            async def __aexit__(self, *exc):
+                pass
+        return Request()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record backoff sleeps (without jitter or waiting)"""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+        await real_sleep(0)
+    monkeypatch.setattr(xtream_api.asyncio, "sleep", sleep)
+    monkeypatch.setattr(xtream_api.random, "uniform", lambda a, b: 1.0)
+    return delays
+
+
+def fetch(session, limiter, **kwargs):
+    payload = {"action": "get_short_epg", "stream_id": 1}
+    return asyncio.run(XtreamAPI().afetchListings(session, limiter, API_URL, payload, **kwargs))
+
+
+def test_AdaptiveLimiter_grows_on_fast_successes():
+    limiter = AdaptiveLimiter(limit=2, max_limit=4)
+    for _ in range(2):
+        limiter.success(0.1)
+    assert limiter.limit == 3
+    for _ in range(3 + 4 * 2):
+        limiter.success(0.1)
+    assert limiter.limit == 4
+
+
+def test_AdaptiveLimiter_halves_on_failure_and_regrows():
+    limiter = AdaptiveLimiter(limit=8)
+    limiter.failure()
+    assert limiter.limit == 4
+    limiter.failure()
+    limiter.failure()
+    limiter.failure()
+    assert limiter.limit == 1
+    limiter.success(0.1)
+    assert limiter.limit == 2
+
+
+def test_AdaptiveLimiter_sheds_a_slot_after_sustained_slowness():
+    limiter = AdaptiveLimiter(limit=8, max_limit=8, slow=3.0, patience=3)
+    for _ in range(5):
+        limiter.success(0.1)
+    limiter.success(1.0)
+    limiter.success(1.0)
+    limiter.success(0.1)  # -- a fast response resets the streak
+    limiter.success(1.0)
+    limiter.success(1.0)
+    assert limiter.limit == 8
+    limiter.success(1.0)
+    assert limiter.limit == 7
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_afetchListings_retries_and_drops_limit(sleeps, status):
+    limiter = AdaptiveLimiter(limit=8)
+    session = FakeSession(FakeResponse(status), FakeResponse(status))
+    assert fetch(session, limiter, retries=3, backoff=1.0) == [{"id": 1}]
+    assert session.calls == 3
+    assert sleeps == [1.0, 2.0]
+    assert limiter.limit == 2
+    assert limiter.in_flight == 0
+
+
+def test_afetchListings_honours_retry_after(sleeps):
+    session = FakeSession(FakeResponse(429, headers={"Retry-After": "7"}), FakeResponse(503))
+    assert fetch(session, AdaptiveLimiter(), retries=2, backoff=1.0) == [{"id": 1}]
+    assert sleeps == [7.0, 2.0]
+
+
+def test_afetchListings_retries_timeouts(sleeps):
+    session = FakeSession(asyncio.TimeoutError(), aiohttp.ClientConnectionError())
+    assert fetch(session, AdaptiveLimiter(), retries=2, backoff=0.5) == [{"id": 1}]
+    assert sleeps == [0.5, 1.0]
+
+
+def test_afetchListings_gives_up_after_retries(sleeps):
+    limiter = AdaptiveLimiter(limit=4)
+    session = FakeSession(*[FakeResponse(502)] * 3)
+    with pytest.raises(aiohttp.ClientResponseError) as e:
+        fetch(session, limiter, retries=2)
+    assert e.value.status == 502
+    assert session.calls == 3
+    assert limiter.in_flight == 0
+
+
+def test_afetchListings_does_not_retry_client_errors(sleeps):
+    session = FakeSession(FakeResponse(404))
+    with pytest.raises(aiohttp.ClientResponseError):
+        fetch(session, AdaptiveLimiter(), retries=3)
+    assert session.calls == 1
+    assert sleeps == []
+
+
+def test_afetchListings_keeps_in_flight_under_limit():
+    limiter = AdaptiveLimiter(limit=2, max_limit=6)
+    session = FakeSession(limiter=limiter, latency=0.001)
+    api = XtreamAPI()
+
+    async def run():
+        payloads = [{"action": "get_short_epg", "stream_id": i} for i in range(60)]
+        return await asyncio.gather(*(api.afetchListings(session, limiter, API_URL, p) for p in payloads))
+
+    results = asyncio.run(run())
+    assert [r[0]["id"] for r in results] == list(range(60))
+    assert all(in_flight <= limit for in_flight, limit in session.peaks)
+    assert max(in_flight for in_flight, _ in session.peaks) > 2  # -- the limit grew and was used
+    assert limiter.limit == 6
+
+
+HOUR = 60 * 60
+NOW = int(time.time()) // HOUR * HOUR
+
+
+def listing(stream_id, start, stop):
+    """Xtream listing covering [NOW + start, NOW + stop) hours"""
+    return {"id": f"{stream_id}-{start}", "epg_id": str(stream_id),
+            "start_timestamp": str(NOW + start * HOUR), "stop_timestamp": str(NOW + stop * HOUR)}
+
+
+def stream(stream_id, name=None):
+    return {"stream_id": stream_id, "name": name or f"Channel {stream_id}", "epg_channel_id": f"ch{stream_id}.us",
+            "stream_icon": "", "category_id": "1"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EPGStore(db_path=tmp_path / "epg.db")
+
+
+def stale_ids(store, streams, **kwargs):
+    return [s["stream_id"] for s in store.stale(API_URL, streams, now=NOW, **kwargs)]
+
+
+def test_EPGStore_stale_horizon(store):
+    streams = [stream(1), stream(2), stream(3)]
+    store.update(API_URL, streams[0], [listing(1, 0, 2), listing(1, 2, 30)])
+    store.update(API_URL, streams[1], [listing(2, 0, 6)])
+    assert stale_ids(store, streams, horizon=24 * HOUR) == [2, 3]  # -- 3 was never fetched
+    assert stale_ids(store, streams, horizon=6 * HOUR) == [3]
+    assert stale_ids(store, streams, horizon=31 * HOUR) == [1, 2, 3]
+
+
+def test_EPGStore_stale_meta_hash(store):
+    store.update(API_URL, stream(1), [listing(1, 0, 30)])
+    assert stale_ids(store, [stream(1)]) == []
+    assert stale_ids(store, [stream(1, name="Renamed")]) == [1]
+    assert store.stale(API_URL, [1], now=NOW) == []  # -- bare ids carry no metadata to compare
+
+
+def test_EPGStore_stale_retry_after_empty_listings(store):
+    store.update(API_URL, stream(1), [])
+    fetched = time.time()
+    assert store.stale(API_URL, [stream(1)], retry=HOUR, now=fetched + HOUR - 60) == []
+    assert store.stale(API_URL, [stream(1)], retry=HOUR, now=fetched + HOUR + 1) == [stream(1)]
+
+
+def test_EPGStore_update_replaces_from_first_start(store):
+    store.update(API_URL, stream(1), [listing(1, 0, 1), listing(1, 1, 2), listing(1, 2, 3)])
+    store.update(API_URL, stream(1), [dict(listing(1, 1, 3), id="new")])
+    assert [i["id"] for i in store.listings(API_URL)["1"]] == ["1-0", "new"]
+    assert store.listings(API_URL, start=NOW + HOUR)["1"][0]["id"] == "new"
+    assert store.listings(API_URL, stream_ids=[2]) == {}
+
+
+def test_refreshEPG_fetches_only_stale_streams(store, monkeypatch):
+    api = XtreamAPI()
+    streams = [stream(1), stream(2), stream(3)]
+    api.__dict__["lemo"] = {"api_url": API_URL, "params": {"username": "u", "password": "p"}, "streams": streams}
+    requested = []
+
+    def fetchEPG(streams, iptv="", action="", **kwargs):
+        requested.append([s["stream_id"] for s in streams])
+        return {s["stream_id"]: [listing(s["stream_id"], -1, 30)] for s in streams}
+    monkeypatch.setattr(api, "fetchEPG", fetchEPG)
+
+    epg = api.refreshEPG(iptv="lemo", store=store)
+    assert requested == [[1, 2, 3]] and api.epg_refreshed == 3
+    assert sorted(epg) == ["1", "2", "3"]
+
+    api.refreshEPG(iptv="lemo", store=store)
+    assert requested[-1] == [] and api.epg_refreshed == 0
+
+    streams[1] = stream(2, name="Renamed")
+    api.refreshEPG(iptv="lemo", store=store)
+    assert requested[-1] == [2]
+
+    api.refreshEPG(iptv="lemo", store=store, horizon=31 * HOUR)
+    assert requested[-1] == [1, 2, 3]
+
+
+def test_refreshEPG_short_epg_horizon(store, monkeypatch):
+    api = XtreamAPI()
+    api.__dict__["lemo"] = {"api_url": API_URL, "params": {}, "streams": [stream(1)]}
+    requested = []
+
+    def fetchEPG(streams, iptv="", action="", **kwargs):
+        requested.extend(action for _ in streams)
+        return {s["stream_id"]: [listing(s["stream_id"], 0, 2)] for s in streams}
+    monkeypatch.setattr(api, "fetchEPG", fetchEPG)
+
+    api.refreshEPG(iptv="lemo", store=store, action="get_short_epg")
+    api.refreshEPG(iptv="lemo", store=store, action="get_short_epg")  # -- 2 hours left > 1 hour horizon
+    api.refreshEPG(iptv="lemo", store=store)  # -- the full table wants a day of guide
+    assert requested == ["get_short_epg", "get_simple_data_table"]
+
+
+def b64(text):
+    return b64encode(text.encode()).decode()
+
+
+# -- 2022-01-01 12:00 / 13:00 / 14:00 UTC
+LISTINGS = [
+    {"channel_id": "espn.us", "title": b64("SportsCenter"), "description": b64("Highlights & news"),
+     "start": "2022-01-01 12:00:00", "end": "2022-01-01 13:00:00",
+     "start_timestamp": "1641038400", "stop_timestamp": "1641042000"},
+    {"channel_id": "espn.us", "title": b64("NBA: Heat vs Celtics"), "description": "",
+     "start": "2022-01-01 13:00:00", "end": "2022-01-01 14:00:00",
+     "start_timestamp": "1641042000", "stop_timestamp": "1641045600"},
+]
+ROWS = [
+    ("espn.us", "SportsCenter", 1641038400, 1641042000, "Highlights & news"),
+    ("espn.us", "NBA: Heat vs Celtics", 1641042000, 1641045600, ""),
+]
+
+
+def without_timestamps(listings):
+    return [{k: v for k, v in i.items() if not k.endswith("_timestamp")} for i in listings]
+
+
+@pytest.mark.parametrize("listings", [
+    LISTINGS,
+    {"epg_listings": LISTINGS},
+    json.dumps({"epg_listings": LISTINGS}),
+    json.dumps({"epg_listings": LISTINGS}).encode(),
+], ids=["list", "dict", "str", "bytes"])
+def test_normalizeListings_inputs(listings):
+    assert XtreamAPI().normalizeListings(listings) == ROWS
+
+
+@pytest.mark.parametrize("listings", [
+    without_timestamps(LISTINGS),
+    LISTINGS[:1] + without_timestamps(LISTINGS[1:]),  # -- one listing without timestamps parses them all
+    [dict(i, start_timestamp="", stop_timestamp=None) for i in LISTINGS],
+], ids=["none", "partial", "blank"])
+def test_normalizeListings_pandas_fallback(listings):
+    assert XtreamAPI().normalizeListings(listings) == ROWS
+
+
+def test_normalizeListings_stop_key_fallback():
+    listings = [dict(i, stop=i.pop("end")) for i in without_timestamps(LISTINGS)]
+    assert XtreamAPI().normalizeListings(listings) == ROWS
+
+
+def test_normalizeListings_base64():
+    listings = [dict(LISTINGS[0], title="not base64!", description=None)]
+    tvg_id, title, start, stop, desc = XtreamAPI().normalizeListings(listings)[0]
+    assert (title, desc) == ("not base64!", "")
+    assert XtreamAPI().decode(b64("Caf\u00e9")) == "Caf\u00e9"
+
+
+def test_normalizeListings_epg_fmt():
+    rows = XtreamAPI().normalizeListings(LISTINGS, epg_fmt=True)
+    assert [row[2:4] for row in rows] == [
+        ("20220101070000 -0500", "20220101080000 -0500"),
+        ("20220101080000 -0500", "20220101090000 -0500"),
+    ]
+    assert rows == XtreamAPI().normalizeListings(without_timestamps(LISTINGS), epg_fmt=True)
+
+
+def test_normalizeListings_columnar():
+    api = XtreamAPI()
+    columns = api.normalizeListings(LISTINGS, columnar=True)
+    assert list(columns) == list(XtreamAPI.LISTING_FIELDS)
+    assert columns == {field: list(values) for field, values in zip(XtreamAPI.LISTING_FIELDS, zip(*ROWS))}
+    assert api.normalizeListings({"epg_listings": []}, columnar=True) == {k: [] for k in XtreamAPI.LISTING_FIELDS}
+    assert api.normalizeListings(b'{"epg_listings": null}') == []